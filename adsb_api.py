@@ -0,0 +1,115 @@
+import gzip
+import json
+import threading
+import time
+
+from flask import Response, request
+
+from adsb_stream import AIRCRAFT_FIELDS, aircraft_rows, packet_dict
+
+class CachedJson:
+	"""JSON document that is serialized once per version of its source and served with conditional GET.
+
+	The body, its gzip compressed copy and its ETag are cached until the source's version changes, so
+	polling clients cost one cache lookup. Clients that send the current ETag in If-None-Match get an
+	empty 304 response.
+	"""
+
+	def __init__(self, version, build):
+		"""
+		Parameters
+		----------
+		version : callable
+			Returns the source's current version. Cheap to call.
+		build : callable
+			Returns the source's (version, JSON-ready document).
+		"""
+
+		self._version = version
+		self._build = build
+		# Changes every run, so ETags from before a restart never match
+		self._instance = f'{int(time.time() * 1000):x}'
+		self._cache = (None, None, None, None) # (version, ETag, body, gzipped body)
+		self._lock = threading.Lock()
+
+	def _current(self):
+		"""
+		Returns the cached version, ETag and body, serializing the document if the source changed.
+		"""
+		with self._lock:
+			if self._cache[0] != self._version():
+				version, document = self._build()
+				body = json.dumps(document, separators=(',', ':')).encode()
+				self._cache = (version, f'"{self._instance}-{version}"', body, None)
+			return self._cache
+
+	def _gzipped(self, cache):
+		"""
+		Returns the gzipped body of a cache entry, compressing it once.
+		"""
+		with self._lock:
+			if self._cache[0] == cache[0] and self._cache[3] != None:
+				return self._cache[3]
+			compressed = gzip.compress(cache[2], compresslevel=6)
+			if self._cache[0] == cache[0]:
+				self._cache = self._cache[:3] + (compressed,)
+			return compressed
+
+	def response(self):
+		"""
+		Returns the Flask response for the current request.
+		"""
+
+		cache = self._current()
+		etag = cache[1]
+		headers = { 'ETag' : etag, 'Cache-Control' : 'no-cache', 'Vary' : 'Accept-Encoding' }
+
+		if request.if_none_match.contains_weak(etag.strip('"')):
+			return Response(status=304, headers=headers)
+
+		if 'gzip' in request.accept_encodings:
+			headers['Content-Encoding'] = 'gzip'
+			return Response(self._gzipped(cache), mimetype='application/json', headers=headers)
+
+		return Response(cache[2], mimetype='application/json', headers=headers)
+
+def register(server, planes, packets):
+	"""
+	Adds the read-only JSON endpoints to a Flask server.
+
+	'/data/aircraft.json' : { "now" : float, "messages" : int, "aircraft" : [ { "hex" : icao, field : value } ] }
+		Every tracked aircraft, like dump1090's aircraft.json. 'seen' is the number of seconds since the
+		aircraft was last heard from, as of 'now'. Unknown values are null.
+	'/data/packets.json' : { "now" : float, "seq" : int, "packets" : [ packet ] }
+		The buffered packets, oldest first. 'seq' is the sequence number of the newest packet.
+
+	Parameters
+	----------
+	server : flask.Flask
+		The server, e.g. the `server` attribute of a Dash app.
+	planes : adsb_objects.AircraftStore
+		The tracked aircraft.
+	packets : adsb_objects.PacketBuffer
+		The buffer of received packets.
+	"""
+
+	def build_aircraft():
+		version, snapshot = planes.snapshot()
+		now = time.time()
+		aircraft = []
+		for icao, row in aircraft_rows(snapshot).items():
+			entry = { 'hex' : icao }
+			entry.update( (field, value) for (field, _), value in zip(AIRCRAFT_FIELDS, row) )
+			entry['seen'] = round(now - entry['seen'], 1)
+			aircraft.append(entry)
+		return version, { 'now' : now, 'messages' : packets.seq, 'aircraft' : aircraft }
+
+	def build_packets():
+		seq, buffered = packets.since(0)
+		return seq, { 'now' : time.time(), 'seq' : seq, 'packets' : [ packet_dict(p) for p in buffered ] }
+
+	aircraft_json = CachedJson(lambda: planes.version, build_aircraft)
+	packets_json = CachedJson(lambda: packets.seq, build_packets)
+
+	server.add_url_rule('/data/aircraft.json', 'aircraft_json', aircraft_json.response)
+	server.add_url_rule('/data/packets.json', 'packets_json', packets_json.response)
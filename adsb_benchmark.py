@@ -0,0 +1,195 @@
+"""
+Benchmarks the ADS-B signal path against synthetic signals with a known ground truth.
+
+Run `python adsb_benchmark.py --help` for the scenario options.
+"""
+
+import numpy as np
+import argparse
+import contextlib
+import io
+import threading
+import time
+
+import adsb_signal_processing as asp
+import adsb_synth as synth
+from adsb_ringbuffer import SampleRingBuffer
+
+def chunks(y, N_samples):
+	"""
+	Splits the signal into chunks the way the ring buffer delivers them, each carrying the end of the previous one.
+	Yields (offset, chunk) pairs.
+	"""
+	overlap = asp.ROW_SIZE - 1
+	for start in range(0, len(y), N_samples):
+		offset = start - overlap if start > 0 else 0
+		yield offset, y[offset : start + N_samples]
+
+def score(decoded, truth, tolerance=2):
+	"""
+	Matches decoded messages against the ground truth.
+
+	Parameters
+	----------
+	decoded : list of (int, str)
+		The preamble index and hex string of every decoded message.
+	truth : list of (int, str)
+		The preamble index and hex string of every transmitted message.
+	tolerance : int, optional
+		How many samples a decoded preamble index may be off by.
+
+	Returns
+	-------
+	dict
+		'matched' transmitted messages that were decoded, 'duplicates' extra decodes of an already matched
+		transmission, and 'false_positives' decoded messages that were never transmitted.
+	"""
+
+	starts = np.array([n for n, _ in truth], dtype=np.int64)
+	matched = set()
+	duplicates = 0
+	false_positives = 0
+
+	for n, msg in decoded:
+		lo = np.searchsorted(starts, n - tolerance)
+		hi = np.searchsorted(starts, n + tolerance, side='right')
+		hits = [i for i in range(lo, hi) if truth[i][1].startswith(msg)]
+		if len(hits) == 0:
+			false_positives += 1
+		elif hits[0] in matched:
+			duplicates += 1
+		else:
+			matched.add(hits[0])
+
+	return { 'matched' : len(matched), 'duplicates' : duplicates, 'false_positives' : false_positives }
+
+def bench_detect(y, N_samples):
+	"""
+	Times `detectPreamble` over every chunk of the signal.
+	"""
+
+	n_candidates = 0
+	noise = asp.NoiseFloor()
+	start = time.perf_counter()
+	for _, chunk in chunks(y, N_samples):
+		idx_preamble, _ = asp.detectPreamble(chunk, noise.update(chunk))
+		n_candidates += len(idx_preamble)
+	elapsed = time.perf_counter() - start
+
+	return { 'samples/s' : len(y) / elapsed, 'candidates' : n_candidates }
+
+def bench_decode(y, N_samples, truth, fix_1bit_errors=False, max_candidates=20000):
+	"""
+	Times `decode_ADSB` on each candidate and `decode_ADSB_batch` on each chunk, and scores the batch results.
+	"""
+
+	noise = asp.NoiseFloor()
+	candidates = [(offset, chunk, asp.detectPreamble(chunk, noise.update(chunk))[0]) for offset, chunk in chunks(y, N_samples)]
+
+	# Per-candidate decoding is slow, so only time up to max_candidates of them
+	n_single = 0
+	start = time.perf_counter()
+	for offset, chunk, idx_preamble in candidates:
+		for n in idx_preamble[:max_candidates - n_single].tolist():
+			asp.decode_ADSB(chunk[n : n + asp.ROW_SIZE], fix_1bit_errors)
+		n_single += min(len(idx_preamble), max_candidates - n_single)
+	single_elapsed = time.perf_counter() - start
+
+	decoded = []
+	start = time.perf_counter()
+	for offset, chunk, idx_preamble in candidates:
+		decoded.extend( (offset + n, msg) for n, msg in asp.decode_ADSB_batch(chunk, idx_preamble, fix_1bit_errors) )
+	batch_elapsed = time.perf_counter() - start
+
+	n_candidates = sum(len(idx_preamble) for _, _, idx_preamble in candidates)
+
+	result = { 'single candidates/s' : n_single / single_elapsed if single_elapsed > 0 else float('inf'),
+			   'batch candidates/s' : n_candidates / batch_elapsed, 'batch samples/s' : len(y) / batch_elapsed,
+			   'decoded' : len(decoded) }
+	result.update(score(decoded, truth))
+
+	return result
+
+def bench_correct(n_msgs=1000, seed=None):
+	"""
+	Times `correct_single_bit_error` on valid messages with one random bit flipped.
+	"""
+
+	rng = np.random.default_rng(seed)
+	msgs = synth.random_messages(n_msgs, seed=seed)
+
+	corrupted = []
+	for msg in msgs:
+		num = int(msg, 16) ^ (1 << int(rng.integers(len(msg) * 4)))
+		corrupted.append(f'{num:0{len(msg)}x}')
+
+	start = time.perf_counter()
+	fixed = [asp.correct_single_bit_error(msg) for msg in corrupted]
+	elapsed = time.perf_counter() - start
+
+	return { 'us/message' : elapsed / n_msgs * 1e6, 'corrected' : sum(f == m for f, m in zip(fixed, msgs)), 'messages' : n_msgs }
+
+def bench_signal_process(y, N_samples, fix_1bit_errors=False):
+	"""
+	Times the full `main.signal_process` loop, fed through a ring buffer like a replayed recording.
+	"""
+
+	# Imported here since main needs the full dashboard environment
+	import main
+
+	samples = SampleRingBuffer(len(y), overlap=asp.ROW_SIZE - 1, dtype=y.dtype)
+	samples.write(y)
+	samples.close()
+
+	start = time.perf_counter()
+	n_decoded = main.signal_process(samples, N_samples, threading.Event(), None, [0.0, 0.0], fix_1bit_errors)
+	elapsed = time.perf_counter() - start
+
+	return { 'samples/s' : len(y) / elapsed, 'decoded' : n_decoded }
+
+def print_result(name, result):
+	"""
+	Prints one benchmark's results on a line.
+	"""
+	fields = [f"{k}: {v:,.0f}" if isinstance(v, float) else f"{k}: {v}" for k, v in result.items()]
+	print(f"{name:<26}" + ", ".join(fields))
+
+def main():
+	parser = argparse.ArgumentParser(
+		description='Benchmark the ADS-B signal path against a synthetic signal with a known ground truth.'
+	)
+	parser.add_argument('--seconds', type=float, default=4.096, help='Length of the synthetic signal in seconds. Default to 4.096 seconds.')
+	parser.add_argument('--snr', type=float, default=20, help='Pulse SNR of the transmissions in dB. Default to 20 dB.')
+	parser.add_argument('--rate', type=float, default=500, help='Messages per second. Default to 500.')
+	parser.add_argument('--overlap', type=float, default=0.0, help='Fraction of messages overlapping the previous one. Default to 0.')
+	parser.add_argument('--freq-offset', type=float, default=0.0, dest='freq_offset', help='Carrier frequency offset in Hz. Default to 0.')
+	parser.add_argument('--fix-single-bit-errors', action='store_true', dest='fix_1bit_errors', help='Enable single bit error correction while decoding.')
+	parser.add_argument('--full-loop', action='store_true', dest='full_loop', help='Also benchmark main.signal_process. Requires the dashboard dependencies.')
+	parser.add_argument('--seed', type=int, default=0, help='Random seed. Default to 0.')
+	args = parser.parse_args()
+
+	fs = 2000000
+	N_samples = 2048000
+
+	n_samples = int(args.seconds * fs)
+	msgs = synth.random_messages(int(args.rate * args.seconds), seed=args.seed)
+	iq, truth = synth.generate(msgs, n_samples, args.snr, args.rate, args.overlap, args.freq_offset, fs, args.seed)
+	y = np.abs(iq)
+
+	print(f"{n_samples:,} samples, {len(truth)} messages injected at {args.snr} dB SNR, {args.overlap:.0%} overlapping")
+
+	# Silence the progress characters printed while decoding
+	with contextlib.redirect_stdout(io.StringIO()):
+		results = [
+			('detectPreamble', bench_detect(y, N_samples)),
+			('decode_ADSB', bench_decode(y, N_samples, truth, args.fix_1bit_errors)),
+			('correct_single_bit_error', bench_correct(seed=args.seed)),
+		]
+		if args.full_loop:
+			results.append(('signal_process', bench_signal_process(y, N_samples, args.fix_1bit_errors)))
+
+	for name, result in results:
+		print_result(name, result)
+
+if __name__ == '__main__':
+	main()
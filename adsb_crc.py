@@ -0,0 +1,243 @@
+import numpy as np
+
+# Mode S CRC-24 generator polynomial (x^24 + x^23 + ... + x^10 + x^3 + 1), without the x^24 term
+GENERATOR = 0xFFF409
+
+def _build_table():
+	"""Builds the byte-wise lookup table for the Mode S CRC-24.
+
+	Returns
+	-------
+	numpy.array
+		256 uint32 entries. Entry i is the CRC of the byte i followed by 24 zero bits.
+	"""
+
+	table = np.zeros(256, dtype=np.uint32)
+	for i in range(256):
+		crc = i << 16
+		for _ in range(8):
+			crc <<= 1
+			if crc & 0x1000000:
+				crc ^= GENERATOR
+		table[i] = crc & 0xFFFFFF
+
+	return table
+
+CRC_TABLE = _build_table()
+_CRC_TABLE_LIST = CRC_TABLE.tolist()
+
+def crc24(msg):
+	"""Calculates the CRC-24 residual of a Mode S message.
+
+	Gives the same result as `pyModeS.crc` on the equivalent hex string.
+
+	Parameters
+	----------
+	msg : bytes
+		The raw 7 or 14 byte message, including its 24 parity bits.
+
+	Returns
+	-------
+	int
+		The CRC residual. 0 if the message passed the CRC check.
+		For messages with address/parity fields this is the transmitter's address.
+	"""
+
+	crc = 0
+	for byte in msg[:-3]:
+		crc = ((crc << 8) & 0xFFFFFF) ^ _CRC_TABLE_LIST[(crc >> 16) ^ byte]
+
+	return crc ^ int.from_bytes(msg[-3:], 'big')
+
+def crc24_batch(msgs):
+	"""Calculates the CRC-24 residual of every row in a matrix of Mode S messages.
+
+	Parameters
+	----------
+	msgs : numpy.array
+		A (N, L) uint8 matrix holding one raw message per row. L is 7 for short messages and 14 for long messages.
+
+	Returns
+	-------
+	numpy.array
+		The uint32 CRC residual of each row. 0 where the message passed the CRC check.
+	"""
+
+	msgs = np.asarray(msgs, dtype=np.uint8)
+	crc = np.zeros(len(msgs), dtype=np.uint32)
+
+	# Process one byte column of every message at a time
+	for col in range(msgs.shape[1] - 3):
+		crc = ((crc << 8) & 0xFFFFFF) ^ CRC_TABLE[(crc >> 16) ^ msgs[:, col]]
+
+	parity = (msgs[:, -3].astype(np.uint32) << 16) | (msgs[:, -2].astype(np.uint32) << 8) | msgs[:, -1]
+
+	return crc ^ parity
+
+def _build_syndromes(n_bits):
+	"""Builds the table of single-bit error syndromes for messages of the given length.
+
+	The CRC is linear, so flipping bit k of any message changes its residual by the residual
+	of a message that only has bit k set. That residual is the syndrome of bit k.
+
+	Parameters
+	----------
+	n_bits : int
+		The message length in bits. 56 for short messages, 112 for long messages.
+
+	Returns
+	-------
+	dict of (int : int)
+		Maps each syndrome to the position of the erroneous bit, counted from the first (most significant) bit.
+	"""
+
+	return { crc24((1 << (n_bits - 1 - k)).to_bytes(n_bits // 8, 'big')) : k for k in range(n_bits) }
+
+def _build_two_bit_syndromes(single_bit):
+	"""Builds the table of two-bit error syndromes from a single-bit syndrome table.
+
+	Bits of the 5-bit downlink format field are left out, so a correction can never turn
+	a message into a different downlink format. Syndromes shared by more than one bit
+	pattern, including any single-bit pattern, are also left out since they cannot be
+	corrected unambiguously.
+
+	Parameters
+	----------
+	single_bit : dict of (int : int)
+		The single-bit syndrome table for the message length.
+
+	Returns
+	-------
+	dict of (int : tuple(int, int))
+		Maps each syndrome to the positions of the two erroneous bits.
+	"""
+
+	by_bit = { k : s for s, k in single_bit.items() }
+	n_bits = len(by_bit)
+
+	syndromes = {}
+	ambiguous = set(single_bit)
+	for i in range(5, n_bits):
+		for j in range(i + 1, n_bits):
+			s = by_bit[i] ^ by_bit[j]
+			if s in syndromes:
+				ambiguous.add(s)
+			syndromes[s] = (i, j)
+
+	return { s : bits for s, bits in syndromes.items() if s not in ambiguous }
+
+def _build_lookup(table):
+	"""Converts a syndrome table into sorted arrays for vectorized lookups.
+
+	Returns
+	-------
+	numpy.array
+		The sorted uint32 syndromes.
+	numpy.array
+		The (N, k) bit positions belonging to each syndrome.
+	"""
+
+	keys = sorted(table)
+	bits = np.array([table[s] for s in keys], dtype=np.int64).reshape(len(keys), -1)
+
+	return np.array(keys, dtype=np.uint32), bits
+
+# Syndrome -> erroneous bit position(s), keyed by message length in bytes
+SYNDROMES = { 7 : _build_syndromes(56), 14 : _build_syndromes(112) }
+TWO_BIT_SYNDROMES = { 14 : _build_two_bit_syndromes(SYNDROMES[14]) }
+
+_SYNDROME_LOOKUP = { n : _build_lookup(table) for n, table in SYNDROMES.items() }
+_TWO_BIT_SYNDROME_LOOKUP = { n : _build_lookup(table) for n, table in TWO_BIT_SYNDROMES.items() }
+
+def _flip_bits(msg, bits):
+	"""Returns a copy of the message with the given bit positions flipped."""
+
+	msg = bytearray(msg)
+	for k in bits:
+		msg[k // 8] ^= 0x80 >> (k % 8)
+
+	return bytes(msg)
+
+def fix_errors(msg, fix_2bit_errors=False):
+	"""Attempts to correct bit errors in a Mode S message with one CRC and one table lookup.
+
+	Parameters
+	----------
+	msg : bytes
+		The raw 7 or 14 byte message.
+	fix_2bit_errors : bool, optional
+		Whether or not to also correct two-bit errors. Only applied to DF17 messages.
+
+	Returns
+	-------
+	bytes
+		The corrected message, or the message itself if it already passes the CRC check.
+		Returns None if no correction was found.
+	"""
+
+	syndrome = crc24(msg)
+	if syndrome == 0:
+		return msg
+
+	bit = SYNDROMES[len(msg)].get(syndrome)
+	if bit != None:
+		return _flip_bits(msg, (bit,))
+
+	if fix_2bit_errors and len(msg) == 14 and (msg[0] >> 3) == 17:
+		bits = TWO_BIT_SYNDROMES[14].get(syndrome)
+		if bits != None:
+			return _flip_bits(msg, bits)
+
+	return None
+
+def _fix_batch(msgs, residuals, candidates, lookup):
+	"""Flips the bits given by a syndrome lookup in the candidate rows of a message matrix.
+
+	Returns
+	-------
+	numpy.array
+		Boolean mask of the rows that were corrected.
+	"""
+
+	keys, bits = lookup
+	pos = np.searchsorted(keys, residuals)
+	pos[pos == len(keys)] = 0
+	found = candidates & (keys[pos] == residuals)
+
+	rows = np.flatnonzero(found)
+	for b in bits[pos[rows]].T:
+		msgs[rows, b // 8] ^= (0x80 >> (b % 8)).astype(np.uint8)
+
+	return found
+
+def fix_errors_batch(msgs, residuals, fix_2bit_errors=False):
+	"""Attempts to correct bit errors in every row of a matrix of Mode S messages.
+
+	Parameters
+	----------
+	msgs : numpy.array
+		A (N, L) uint8 matrix holding one raw message per row. L is 7 or 14.
+	residuals : numpy.array
+		The CRC residuals of the rows, as returned by `crc24_batch`.
+	fix_2bit_errors : bool, optional
+		Whether or not to also correct two-bit errors. Only applied to DF17 messages.
+
+	Returns
+	-------
+	numpy.array
+		A copy of the matrix with the correctable rows fixed.
+	numpy.array
+		Boolean mask of the rows that were corrected.
+	"""
+
+	msgs = np.array(msgs, dtype=np.uint8)
+	residuals = np.asarray(residuals, dtype=np.uint32)
+	n_bytes = msgs.shape[1]
+
+	fixed = _fix_batch(msgs, residuals, residuals != 0, _SYNDROME_LOOKUP[n_bytes])
+
+	if fix_2bit_errors and n_bytes in _TWO_BIT_SYNDROME_LOOKUP:
+		df17 = (msgs[:, 0] >> 3) == 17
+		fixed |= _fix_batch(msgs, residuals, ~fixed & (residuals != 0) & df17, _TWO_BIT_SYNDROME_LOOKUP[n_bytes])
+
+	return msgs, fixed
@@ -0,0 +1,377 @@
+"""
+Decodes the fields of DF17/DF18 extended squitter messages with bit operations on the 112-bit message.
+
+Messages are handled as Python integers, see `to_int`. Field positions are counted in bits from the
+start of the message, so the 56-bit ME field starts at bit 32. The results match pyModeS.
+"""
+
+import math
+from bisect import bisect_right
+
+CALLSIGN_CHARS = '#ABCDEFGHIJKLMNOPQRSTUVWXYZ#####_###############0123456789######'
+
+# Frames further apart than this many seconds are not paired for global position decoding
+CPR_PAIR_MAX_AGE = 10
+# Local position decoding is only trusted this many seconds after the last known position,
+# less than the time needed to fly half a latitude zone (180 NM) at airliner speeds
+CPR_LOCAL_MAX_AGE = 600
+
+def _build_nl_table():
+	"""Builds the latitudes where the number of CPR longitude zones changes.
+
+	Returns
+	-------
+	list(float)
+		Ascending latitudes, in degrees, where NL drops from 59 to 58, 58 to 57, ... and 2 to 1.
+	"""
+
+	nz = 15
+	a = 1 - math.cos(math.pi / (2 * nz))
+	return [ math.degrees(math.acos(math.sqrt(a / (1 - math.cos(2 * math.pi / nl))))) for nl in range(59, 1, -1) ]
+
+NL_TABLE = _build_nl_table()
+
+def cpr_nl(lat):
+	"""
+	Returns the number of CPR longitude zones at a latitude, the NL() function of the CPR specification.
+	"""
+	return 59 - bisect_right(NL_TABLE, abs(lat))
+
+def to_int(msg):
+	"""
+	Converts a raw message (bytes) or a hex string into the integer the decoding functions work on.
+	"""
+	if isinstance(msg, str):
+		return int(msg, 16)
+	return int.from_bytes(msg, 'big')
+
+def df(msg):
+	"""
+	Returns the downlink format of a 112-bit message.
+	"""
+	return msg >> 107
+
+def icao(msg):
+	"""
+	Returns the ICAO address of a DF17/DF18 message as an uppercase hex string.
+	"""
+	return f'{(msg >> 80) & 0xFFFFFF:06X}'
+
+def typecode(msg):
+	"""
+	Returns the typecode of a DF17/DF18 message.
+	"""
+	return (msg >> 75) & 0x1F
+
+def callsign(msg):
+	"""Decodes the callsign of an identification message (TC 1-4).
+
+	Parameters
+	----------
+	msg : int
+		The 112-bit message.
+
+	Returns
+	-------
+	str
+		The callsign, padded with '_' to 8 characters.
+	"""
+
+	chars = [ CALLSIGN_CHARS[(msg >> shift) & 0x3F] for shift in range(66, 18, -6) ]
+	return ''.join(chars).replace('#', '')
+
+def _gillham_altitude(code):
+	"""
+	Decodes a 12-bit Gillham (Gray code) altitude in 100 ft steps. Returns None for invalid codes.
+	"""
+
+	# The 12-bit field is C1 A1 C2 A2 C4 A4 B1 Q B2 D2 B4 D4
+	bit = lambda k: (code >> (11 - k)) & 1
+	c1, a1, c2, a2, c4, a4, b1, b2, d2, b4, d4 = (bit(k) for k in (0, 1, 2, 3, 4, 5, 6, 8, 9, 10, 11))
+
+	n500 = (d2 << 7) | (d4 << 6) | (a1 << 5) | (a2 << 4) | (a4 << 3) | (b1 << 2) | (b2 << 1) | b4
+	n100 = (c1 << 2) | (c2 << 1) | c4
+
+	# Gray code to binary
+	for shift in (4, 2, 1):
+		n500 ^= n500 >> shift
+	n100 ^= n100 >> 2
+	n100 ^= n100 >> 1
+
+	if n100 in (0, 5, 6):
+		return None
+	if n100 == 7:
+		n100 = 5
+	if n500 % 2:
+		n100 = 6 - n100
+
+	return n500 * 500 + n100 * 100 - 1300
+
+def altitude(msg):
+	"""Decodes the altitude of an airborne position message (TC 9-18 and 20-22).
+
+	Parameters
+	----------
+	msg : int
+		The 112-bit message.
+
+	Returns
+	-------
+	int
+		The altitude in feet. Barometric for TC 9-18, GNSS for TC 20-22. None if unavailable.
+	"""
+
+	code = (msg >> 60) & 0xFFF
+
+	if typecode(msg) >= 20:
+		return int(code * 3.28084)
+
+	if code == 0:
+		return None
+
+	# Q bit set: 25 ft steps, the Q bit is dropped from the 11-bit value
+	if code & 0x10:
+		return ((code >> 5) << 4 | (code & 0xF)) * 25 - 1000
+
+	return _gillham_altitude(code)
+
+def cpr(msg):
+	"""Extracts the CPR encoded position of an airborne or surface position message.
+
+	Parameters
+	----------
+	msg : int
+		The 112-bit message.
+
+	Returns
+	-------
+	int
+		1 for an odd frame, 0 for an even frame.
+	int
+		The 17-bit CPR latitude.
+	int
+		The 17-bit CPR longitude.
+	"""
+
+	return (msg >> 58) & 1, (msg >> 41) & 0x1FFFF, (msg >> 24) & 0x1FFFF
+
+def airborne_position(even, odd, odd_is_newer):
+	"""Globally decodes an airborne position from a pair of even and odd CPR frames.
+
+	Parameters
+	----------
+	even : tuple(int, int)
+		The CPR latitude and longitude of the even frame.
+	odd : tuple(int, int)
+		The CPR latitude and longitude of the odd frame.
+	odd_is_newer : bool
+		Whether the odd frame was received last. The position is that of the newest frame.
+
+	Returns
+	-------
+	tuple(float, float)
+		The latitude and longitude. None if the frames straddle a longitude zone boundary and cannot be combined.
+	"""
+
+	lat_even_cpr, lon_even_cpr = even[0] / 131072, even[1] / 131072
+	lat_odd_cpr, lon_odd_cpr = odd[0] / 131072, odd[1] / 131072
+
+	j = math.floor(59 * lat_even_cpr - 60 * lat_odd_cpr + 0.5)
+	lat_even = 360 / 60 * (j % 60 + lat_even_cpr)
+	lat_odd = 360 / 59 * (j % 59 + lat_odd_cpr)
+	if lat_even >= 270:
+		lat_even -= 360
+	if lat_odd >= 270:
+		lat_odd -= 360
+
+	nl = cpr_nl(lat_even)
+	if nl != cpr_nl(lat_odd):
+		return None
+
+	m = math.floor(lon_even_cpr * (nl - 1) - lon_odd_cpr * nl + 0.5)
+	if odd_is_newer:
+		lat = lat_odd
+		ni = nl - 1 if nl > 1 else 1
+		lon = 360 / ni * (m % ni + lon_odd_cpr)
+	else:
+		lat = lat_even
+		ni = nl
+		lon = 360 / ni * (m % ni + lon_even_cpr)
+
+	if lon > 180:
+		lon -= 360
+
+	return lat, lon
+
+def surface_position(even, odd, odd_is_newer, lat_ref, lon_ref):
+	"""Globally decodes a surface position from a pair of even and odd CPR frames.
+
+	Surface frames only cover a quarter of the globe, so the receiver's position picks the solution.
+
+	Parameters
+	----------
+	even : tuple(int, int)
+		The CPR latitude and longitude of the even frame.
+	odd : tuple(int, int)
+		The CPR latitude and longitude of the odd frame.
+	odd_is_newer : bool
+		Whether the odd frame was received last. The position is that of the newest frame.
+	lat_ref : float
+		The receiver's latitude.
+	lon_ref : float
+		The receiver's longitude.
+
+	Returns
+	-------
+	tuple(float, float)
+		The latitude and longitude. None if the frames straddle a longitude zone boundary and cannot be combined.
+	"""
+
+	lat_even_cpr, lon_even_cpr = even[0] / 131072, even[1] / 131072
+	lat_odd_cpr, lon_odd_cpr = odd[0] / 131072, odd[1] / 131072
+
+	j = math.floor(59 * lat_even_cpr - 60 * lat_odd_cpr + 0.5)
+	lat_even = 90 / 60 * (j % 60 + lat_even_cpr)
+	lat_odd = 90 / 59 * (j % 59 + lat_odd_cpr)
+	if lat_ref <= 0:
+		lat_even -= 90
+		lat_odd -= 90
+
+	nl = cpr_nl(lat_even)
+	if nl != cpr_nl(lat_odd):
+		return None
+
+	m = math.floor(lon_even_cpr * (nl - 1) - lon_odd_cpr * nl + 0.5)
+	if odd_is_newer:
+		lat = lat_odd
+		ni = nl - 1 if nl > 1 else 1
+		lon = 90 / ni * (m % ni + lon_odd_cpr)
+	else:
+		lat = lat_even
+		ni = nl
+		lon = 90 / ni * (m % ni + lon_even_cpr)
+
+	# Of the four longitude solutions, pick the one closest to the receiver
+	lons = [ (lon + offset + 180) % 360 - 180 for offset in (0, 90, 180, 270) ]
+	lon = min(lons, key=lambda l: abs(lon_ref - l))
+
+	return lat, lon
+
+def position_with_ref(odd, lat_cpr, lon_cpr, lat_ref, lon_ref, surface=False):
+	"""Locally decodes a position from a single CPR frame and a nearby reference position.
+
+	The reference must be within 180 NM of the aircraft for airborne frames, or 45 NM for surface frames.
+
+	Parameters
+	----------
+	odd : int
+		1 for an odd frame, 0 for an even frame.
+	lat_cpr : int
+		The 17-bit CPR latitude.
+	lon_cpr : int
+		The 17-bit CPR longitude.
+	lat_ref : float
+		The reference latitude, e.g. the aircraft's last known position or the receiver's position.
+	lon_ref : float
+		The reference longitude.
+	surface : bool, optional
+		Whether the frame is from a surface position message.
+
+	Returns
+	-------
+	tuple(float, float)
+		The latitude and longitude.
+	"""
+
+	span = 90 if surface else 360
+	lat_cpr /= 131072
+	lon_cpr /= 131072
+
+	d_lat = span / (60 - odd)
+	j = math.floor(0.5 + lat_ref / d_lat - lat_cpr)
+	lat = d_lat * (j + lat_cpr)
+
+	ni = cpr_nl(lat) - odd
+	d_lon = span / ni if ni > 0 else span
+	m = math.floor(0.5 + lon_ref / d_lon - lon_cpr)
+	lon = d_lon * (m + lon_cpr)
+
+	return lat, lon
+
+def velocity(msg):
+	"""Decodes an airborne velocity message (TC 19).
+
+	Parameters
+	----------
+	msg : int
+		The 112-bit message.
+
+	Returns
+	-------
+	int
+		The ground speed (subtypes 1-2) or airspeed (subtypes 3-4) in knots. None if unavailable.
+	float
+		The ground track (subtypes 1-2) or magnetic heading (subtypes 3-4) in degrees. None if unavailable.
+	int
+		The vertical rate in feet per minute. None if unavailable.
+	"""
+
+	subtype = (msg >> 72) & 0x7
+	vr = (msg >> 34) & 0x1FF
+	vertical_rate = None if vr == 0 else (vr - 1) * 64 * (-1 if (msg >> 43) & 1 else 1)
+
+	if subtype in (1, 2):
+		v_ew = (msg >> 56) & 0x3FF
+		v_ns = (msg >> 45) & 0x3FF
+		if v_ew == 0 or v_ns == 0:
+			return None, None, vertical_rate
+
+		scale = 4 if subtype == 2 else 1
+		v_we = (v_ew - 1) * scale * (-1 if (msg >> 66) & 1 else 1)
+		v_sn = (v_ns - 1) * scale * (-1 if (msg >> 55) & 1 else 1)
+
+		speed = int(math.sqrt(v_sn * v_sn + v_we * v_we))
+		track = math.degrees(math.atan2(v_we, v_sn))
+		return speed, track if track >= 0 else track + 360, vertical_rate
+
+	heading = ((msg >> 56) & 0x3FF) / 1024 * 360.0 if (msg >> 66) & 1 else None
+	speed = (msg >> 45) & 0x3FF
+	speed = None if speed == 0 else (speed - 1) * (4 if subtype == 4 else 1)
+
+	return speed, heading, vertical_rate
+
+# Lower bounds of the surface movement codes, with the speed in knots at each bound and the step size above it
+_MOVEMENT_CODES = [2, 9, 13, 39, 94, 109, 124]
+_MOVEMENT_KNOTS = [0.125, 1, 2, 15, 70, 100, 175]
+_MOVEMENT_STEPS = [0.125, 0.25, 0.5, 1, 2, 5]
+
+def surface_velocity(msg):
+	"""Decodes the ground speed and track of a surface position message (TC 5-8).
+
+	Parameters
+	----------
+	msg : int
+		The 112-bit message.
+
+	Returns
+	-------
+	float
+		The ground speed in knots. None if unavailable.
+	float
+		The ground track in degrees. None if unavailable.
+	"""
+
+	track = ((msg >> 60) & 0x7F) * 360 / 128 if (msg >> 67) & 1 else None
+
+	movement = (msg >> 68) & 0x7F
+	if movement == 0 or movement > 124:
+		speed = None
+	elif movement == 1:
+		speed = 0.0
+	elif movement == 124:
+		speed = 175.0
+	else:
+		i = bisect_right(_MOVEMENT_CODES, movement) - 1
+		speed = _MOVEMENT_KNOTS[i] + (movement - _MOVEMENT_CODES[i]) * _MOVEMENT_STEPS[i]
+
+	return speed, track
@@ -0,0 +1,316 @@
+import math
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import numpy as np
+from flask import jsonify, request
+
+import adsb_objects as ao
+from adsb_stream import packet_dict
+
+# ICAO addresses are stored as integers, which keeps the rows and indexes small
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS packets (
+	time REAL NOT NULL,
+	icao INTEGER,
+	df INTEGER NOT NULL,
+	typecode INTEGER,
+	snr REAL,
+	msg BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS packets_time ON packets (time);
+CREATE INDEX IF NOT EXISTS packets_icao_time ON packets (icao, time);
+
+CREATE TABLE IF NOT EXISTS positions (
+	time REAL NOT NULL,
+	icao INTEGER NOT NULL,
+	lat REAL NOT NULL,
+	lon REAL NOT NULL,
+	altitude REAL
+);
+CREATE INDEX IF NOT EXISTS positions_time ON positions (time);
+CREATE INDEX IF NOT EXISTS positions_icao_time ON positions (icao, time);
+"""
+
+def _is_position(packet):
+	"""
+	Returns whether a packet is an airborne or surface position message.
+	"""
+	tc = packet.typecode
+	return tc != None and tc >= 5 and tc <= 22 and tc != 19
+
+class HistoryStore:
+	"""SQLite database of every decoded packet and position fix, written from a background thread.
+
+	Packets are queued by the decoder and inserted in batches, one transaction per batch, so the
+	database never stalls decoding. If the queue fills up, packets are dropped and counted instead.
+	The database is in WAL mode, so queries can run while the writer inserts, and both tables are
+	indexed by time and by ICAO address and time. Queries see packets once their batch is committed,
+	at most `flush_interval` seconds after they are recorded.
+
+	Tables
+	------
+	packets : time, icao, df, typecode, snr, msg
+		Every packet. `icao` is the ICAO address as an integer, NULL for formats without one.
+	positions : time, icao, lat, lon, altitude
+		Every position fix, with the altitude in feet known at the time. NULL if unknown.
+
+	Attributes
+	----------
+	path : str
+		The database file.
+	dropped : int
+		The number of packets dropped because the queue was full.
+	written : int
+		The number of packets written to the database.
+	"""
+
+	def __init__(self, path, flush_interval=1.0, queue_size=65536):
+		"""
+		Parameters
+		----------
+		path : str
+			The database file. Created if it does not exist. Raises sqlite3.Error if it cannot be opened.
+		flush_interval : float, optional
+			The maximum number of seconds a packet waits before it is written out.
+		queue_size : int, optional
+			The maximum number of packets waiting to be written.
+		"""
+
+		self.path = path
+		self.flush_interval = flush_interval
+		self.dropped = 0
+		self.written = 0
+
+		# Set up the database here, so a bad path fails at startup instead of in the writer
+		with closing(self._connect()) as db:
+			db.execute('PRAGMA journal_mode=WAL')
+			db.executescript(SCHEMA)
+
+		self._queue = queue.Queue(queue_size)
+		self._thread = threading.Thread(target=self._run, name='HistoryStore', daemon=True)
+		self._thread.start()
+
+	def _connect(self):
+		"""
+		Opens a connection to the database. Connections can only be used by the thread that opened them.
+		"""
+		db = sqlite3.connect(self.path, timeout=10)
+		# In WAL mode, NORMAL only syncs at checkpoints. A crash can lose the last batches but never corrupts the database.
+		db.execute('PRAGMA synchronous=NORMAL')
+		# Inserts land all over the ICAO indexes, a larger page cache keeps them from rereading pages. Up to 32MiB.
+		db.execute('PRAGMA cache_size=-32768')
+		return db
+
+	def record(self, packet, plane=None):
+		"""
+		Queues a packet to be written, along with the position fix it gave its plane, if any. Never blocks.
+
+		Parameters
+		----------
+		packet : adsb_objects.Packet
+			The packet to record.
+		plane : adsb_objects.Plane, optional
+			The plane the packet was processed by.
+		"""
+
+		fix = None
+		if plane != None and _is_position(packet):
+			# A position message that was decoded is the newest point in the plane's trail
+			point = plane.trail.latest()
+			if point is not None and point[0] == packet.timestamp:
+				fix = (float(point[1]), float(point[2]), None if math.isnan(point[3]) else float(point[3]))
+
+		icao = packet.icao
+		snr = None if packet.snr == None else float(packet.snr)
+		try:
+			self._queue.put_nowait((packet.timestamp, None if icao == None else int(icao, 16), packet.df, packet.typecode, snr, packet.raw, fix))
+		except queue.Full:
+			self.dropped += 1
+
+	def close(self):
+		"""
+		Writes out the queued packets and closes the database.
+		"""
+		# Wake the writer with a sentinel, it stops once everything before it is written.
+		# Only wait for room in the queue while the writer is still there to make some.
+		while self._thread.is_alive():
+			try:
+				self._queue.put(None, timeout=self.flush_interval)
+				break
+			except queue.Full:
+				pass
+		self._thread.join()
+
+	def _run(self):
+		"""
+		Background thread. Inserts queued packets in batches until the store is closed.
+		"""
+		db = self._connect()
+		running = True
+		while running:
+			try:
+				batch = [self._queue.get(timeout=self.flush_interval)]
+			except queue.Empty:
+				continue
+
+			# Collect everything else waiting so it's inserted in one transaction
+			while True:
+				try:
+					batch.append(self._queue.get_nowait())
+				except queue.Empty:
+					break
+
+			if None in batch:
+				running = False
+				batch = [record for record in batch if record != None]
+
+			# A bad batch is reported and dropped, the writer keeps going
+			try:
+				self._write(db, batch)
+			except Exception as e:
+				print(f"\n*** Error writing to {self.path} - {e} ***")
+
+		db.close()
+
+	def _write(self, db, batch):
+		"""
+		Inserts a batch of queued packets and their position fixes in one transaction.
+		"""
+		if len(batch) == 0:
+			return
+
+		with db:
+			db.executemany('INSERT INTO packets VALUES (?, ?, ?, ?, ?, ?)', [ record[:6] for record in batch ])
+			db.executemany('INSERT INTO positions VALUES (?, ?, ?, ?, ?)', [ (record[0], record[1]) + record[6] for record in batch if record[6] != None ])
+		self.written += len(batch)
+
+	def _query(self, sql, params):
+		"""
+		Runs a query on a new connection, so it can be called from any thread, and returns every row.
+		"""
+		with closing(self._connect()) as db:
+			return db.execute(sql, params).fetchall()
+
+	def tracks_between(self, start, end):
+		"""
+		Returns the track of every aircraft with a position fix in a time range.
+
+		Parameters
+		----------
+		start, end : float
+			The Unix timestamps the range starts and ends at, inclusive.
+
+		Returns
+		-------
+		dict of (str : numpy.array)
+			A (n, 4) array of (timestamp, latitude, longitude, altitude) rows for each ICAO address, oldest first.
+			The altitude is NaN where unknown.
+		"""
+
+		# Rows come in time index order, so they only need grouping by aircraft, not sorting
+		rows = self._query('SELECT icao, time, lat, lon, altitude FROM positions WHERE time >= ? AND time <= ? ORDER BY time', (start, end))
+		if len(rows) == 0:
+			return {}
+
+		rows = np.array(rows, dtype=float)
+		icaos = rows[:, 0].astype(np.int64)
+		order = np.argsort(icaos, kind='stable')
+		icaos, first = np.unique(icaos[order], return_index=True)
+		points = rows[order, 1:]
+
+		return { f'{icao:06X}' : track for icao, track in zip(icaos.tolist(), np.split(points, first[1:])) }
+
+	def track(self, icao, start=None, end=None):
+		"""
+		Returns the position fixes of one aircraft.
+
+		Parameters
+		----------
+		icao : str
+			The aircraft's ICAO address.
+		start, end : float, optional
+			The Unix timestamps the fixes must fall between, inclusive. Unbounded if unset.
+
+		Returns
+		-------
+		numpy.array
+			A (n, 4) array of (timestamp, latitude, longitude, altitude) rows, oldest first. The altitude is NaN where unknown.
+		"""
+
+		rows = self._query('SELECT time, lat, lon, altitude FROM positions WHERE icao = ? AND time >= ? AND time <= ? ORDER BY time',
+						   (int(icao, 16), -math.inf if start == None else start, math.inf if end == None else end))
+		return np.array(rows, dtype=float).reshape(-1, 4)
+
+	def history(self, icao, start=None, end=None, limit=None):
+		"""
+		Returns the packets received from one aircraft.
+
+		Parameters
+		----------
+		icao : str
+			The aircraft's ICAO address.
+		start, end : float, optional
+			The Unix timestamps the packets must fall between, inclusive. Unbounded if unset.
+		limit : int, optional
+			Only return this many of the newest packets.
+
+		Returns
+		-------
+		list(adsb_objects.Packet)
+			The packets, oldest first.
+		"""
+
+		rows = self._query('SELECT time, snr, msg FROM packets WHERE icao = ? AND time >= ? AND time <= ? ORDER BY time DESC LIMIT ?',
+						   (int(icao, 16), -math.inf if start == None else start, math.inf if end == None else end, -1 if limit == None else limit))
+		return [ ao.Packet(msg, timestamp, snr) for timestamp, snr, msg in reversed(rows) ]
+
+def _track_rows(track):
+	"""
+	Converts a track array into JSON-ready [timestamp, latitude, longitude, altitude] rows, with None for unknown altitudes.
+	"""
+	return [ [t, lat, lon, None if alt != alt else alt] for t, lat, lon, alt in track.tolist() ]
+
+def register(server, history):
+	"""
+	Adds the history query endpoints to a Flask server.
+
+	'/data/history/tracks.json?start=&end=' : { "start" : float, "end" : float, "tracks" : { icao : [ [t, lat, lon, altitude] ] } }
+		The track of every aircraft between two Unix timestamps. Default to the last hour.
+	'/data/history/<icao>.json?start=&end=&limit=' : { "icao" : str, "packets" : [ packet ], "track" : [ [t, lat, lon, altitude] ] }
+		The packets and track of one aircraft, oldest first. 'limit' keeps only the newest packets.
+
+	Parameters
+	----------
+	server : flask.Flask
+		The server, e.g. the `server` attribute of a Dash app.
+	history : adsb_history.HistoryStore
+		The history to query.
+	"""
+
+	def tracks():
+		end = request.args.get('end', time.time(), type=float)
+		start = request.args.get('start', end - 3600, type=float)
+		found = history.tracks_between(start, end)
+		return jsonify({ 'start' : start, 'end' : end, 'tracks' : { icao : _track_rows(track) for icao, track in found.items() } })
+
+	def aircraft(icao):
+		try:
+			int(icao, 16)
+		except ValueError:
+			return jsonify({ 'error' : f"Invalid ICAO address '{icao}'" }), 400
+
+		start = request.args.get('start', type=float)
+		end = request.args.get('end', type=float)
+		limit = request.args.get('limit', type=int)
+		return jsonify({
+			'icao' : icao.upper(),
+			'packets' : [ packet_dict(p) for p in history.history(icao, start, end, limit) ],
+			'track' : _track_rows(history.track(icao, start, end))
+		})
+
+	server.add_url_rule('/data/history/tracks.json', 'history_tracks', tracks)
+	server.add_url_rule('/data/history/<icao>.json', 'history_aircraft', aircraft)
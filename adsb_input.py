@@ -0,0 +1,497 @@
+"""
+Network input: merges the messages of remote receivers into one picture, in the formats dump1090 serves:
+
+'beast' : Beast binary frames, usually on port 30005.
+'avr' : Raw AVR hex lines (`*8D4840D6...;` or `@<timestamp><message>;`), usually on port 30002.
+
+Every feed is read on one asyncio event loop in a background thread, so dozens of feeds fit on one
+core. Receivers that are close together hear the same transmissions, so a message that another
+feed already delivered within a short window is dropped before it reaches the tracker.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+
+import adsb_crc as crc
+import adsb_metrics as metrics
+import adsb_objects as ao
+
+DEFAULT_PORTS = { 'beast' : 30005, 'avr' : 30002 }
+
+class BeastParser:
+	"""Splits a Beast binary stream into messages.
+
+	A frame is 0x1A, a type byte, a 6 byte 12MHz timestamp, a signal level byte and the message.
+	0x1A bytes inside a frame are doubled. Mode A/C and status frames are skipped.
+	"""
+
+	# Message length of each frame type: '1' Mode A/C, '2' Mode S short, '3' Mode S long
+	FRAME_LENGTHS = { 0x31 : 2, 0x32 : 7, 0x33 : 14 }
+
+	def __init__(self):
+		self._buffer = b''
+
+	def feed(self, data):
+		"""
+		Parses the next bytes of the stream.
+
+		Parameters
+		----------
+		data : bytes
+			The bytes received. Frames may be split across calls.
+
+		Returns
+		-------
+		list of (bytes, int, int)
+			The raw message, signal level and timestamp in 12MHz ticks of each complete frame.
+		"""
+
+		buf = self._buffer + data
+		n = len(buf)
+		frames = []
+		i = 0
+
+		while True:
+			start = buf.find(b'\x1a', i)
+			if start < 0:
+				self._buffer = b''
+				return frames
+			if start + 1 >= n:
+				self._buffer = buf[start:]
+				return frames
+
+			length = self.FRAME_LENGTHS.get(buf[start + 1])
+			if length == None:
+				# An escaped 0x1A or a frame type we don't read, look for the next frame
+				i = start + 2 if buf[start + 1] == 0x1a else start + 1
+				continue
+
+			need = 7 + length
+			j = start + 2
+			if buf.find(b'\x1a', j, j + need) < 0 and j + need <= n:
+				# Nothing escaped, which is most frames
+				payload = buf[j : j + need]
+				j += need
+			else:
+				payload, j = self._unescape(buf, j, need)
+				if payload == None:
+					# Cut short by the start of another frame
+					i = j
+					continue
+				if len(payload) < need:
+					self._buffer = buf[start:]
+					return frames
+
+			i = j
+			if length != 2:
+				frames.append((bytes(payload[7:]), payload[6], int.from_bytes(payload[:6], 'big')))
+
+	@staticmethod
+	def _unescape(buf, j, need):
+		"""
+		Reads up to `need` bytes of a frame starting at `buf[j]`, undoing the doubled 0x1A bytes.
+		Returns the bytes read and where reading stopped, or None instead of the bytes if another frame starts first.
+		"""
+		payload = bytearray()
+		n = len(buf)
+		while len(payload) < need and j < n:
+			if buf[j] == 0x1a:
+				if j + 1 >= n:
+					break
+				if buf[j + 1] != 0x1a:
+					return None, j
+				j += 1
+			payload.append(buf[j])
+			j += 1
+		return payload, j
+
+class AvrParser:
+	"""Splits a raw AVR stream into messages.
+
+	Each line is `*<message>;` or, with a 12MHz timestamp, `@<12 hex digit timestamp><message>;`.
+	Mode A/C and malformed lines are skipped.
+	"""
+
+	def __init__(self):
+		self._buffer = b''
+
+	def feed(self, data):
+		"""
+		Parses the next bytes of the stream.
+
+		Parameters
+		----------
+		data : bytes
+			The bytes received. Lines may be split across calls.
+
+		Returns
+		-------
+		list of (bytes, None, int)
+			The raw message, an unknown signal level and the timestamp in 12MHz ticks (None if unknown) of each complete line.
+		"""
+
+		lines = (self._buffer + data).split(b'\n')
+		self._buffer = lines.pop()
+
+		frames = []
+		for line in lines:
+			line = line.strip()
+			if len(line) < 3 or line[-1:] != b';':
+				continue
+
+			ticks = None
+			if line[:1] == b'*':
+				message = line[1:-1]
+			elif line[:1] == b'@':
+				ticks = line[1:13]
+				message = line[13:-1]
+			else:
+				continue
+
+			try:
+				raw = bytes.fromhex(message.decode())
+				if ticks != None:
+					ticks = int(ticks, 16)
+			except ValueError:
+				continue
+
+			if len(raw) in (7, 14):
+				frames.append((raw, None, ticks))
+
+		return frames
+
+PARSERS = { 'beast' : BeastParser, 'avr' : AvrParser }
+
+def is_valid(raw):
+	"""
+	Returns whether a message from a feed is well formed. Messages whose parity can be checked
+	without knowing the sender (DF11, DF17 and DF18) must pass the CRC check.
+	"""
+	if len(raw) not in (7, 14):
+		return False
+	df = raw[0] >> 3
+	if df in (17, 18):
+		return len(raw) == 14 and crc.crc24(raw) == 0
+	if df == 11:
+		# The parity of an all-call reply is overlaid with a 7 bit interrogator code
+		return crc.crc24(raw) < 0x80
+	return True
+
+class DedupCache:
+	"""Remembers recent messages to drop copies of the same transmission heard by several receivers.
+
+	Messages are keyed by their raw bytes. A message is a duplicate if a different feed delivered
+	the same bytes within the window. The same bytes from the same feed are a new transmission,
+	e.g. a repeated all-call reply, and are kept.
+
+	Attributes
+	----------
+	window : float
+		How long a message is remembered, in seconds.
+	"""
+
+	def __init__(self, window=1.0):
+		"""
+		Parameters
+		----------
+		window : float, optional
+			How long a message is remembered, in seconds. Should cover the difference in latency between the feeds.
+		"""
+
+		self.window = window
+		self._seen = {} # raw message : (time, source) of its last delivery
+		self._order = deque() # (time, raw message) of every delivery, oldest first
+
+	def __len__(self):
+		return len(self._seen)
+
+	def is_duplicate(self, raw, source, now):
+		"""
+		Returns whether a message is a copy of one another source delivered within the window, remembering it if not.
+
+		Parameters
+		----------
+		raw : bytes
+			The raw message.
+		source : object
+			The feed that delivered the message.
+		now : float
+			The time the message was received, in seconds.
+		"""
+
+		self._expire(now)
+
+		entry = self._seen.get(raw)
+		if entry != None and entry[1] is not source:
+			return True
+
+		self._seen[raw] = (now, source)
+		self._order.append((now, raw))
+		return False
+
+	def _expire(self, now):
+		"""
+		Forgets the messages last delivered before the window.
+		"""
+		order = self._order
+		seen = self._seen
+		while len(order) > 0 and now - order[0][0] > self.window:
+			t, raw = order.popleft()
+			entry = seen.get(raw)
+			# Skip entries that were delivered again since
+			if entry != None and entry[0] == t:
+				del seen[raw]
+
+class Feed:
+	"""A remote receiver's TCP feed.
+
+	Attributes
+	----------
+	host : str
+		The receiver's address.
+	port : int
+		The receiver's port.
+	fmt : str
+		The feed's format. One of 'beast' or 'avr'.
+	connected : bool
+		Whether the feed is currently connected.
+	received : int
+		The number of messages received from the feed, including duplicates.
+	"""
+
+	def __init__(self, host, port=None, fmt='beast'):
+		"""
+		Parameters
+		----------
+		host : str
+			The receiver's address.
+		port : int, optional
+			The receiver's port. Default to the usual port for the format.
+		fmt : str, optional
+			The feed's format. One of 'beast' or 'avr'.
+		"""
+
+		if fmt not in PARSERS:
+			raise ValueError(f"Unknown input format '{fmt}', expected one of {tuple(PARSERS)}")
+
+		self.host = host
+		self.port = port if port != None else DEFAULT_PORTS[fmt]
+		self.fmt = fmt
+		self.connected = False
+		self.received = 0
+
+	@classmethod
+	def parse(cls, spec):
+		"""
+		Creates a feed from a `host[:port[:format]]` string. The format defaults to 'avr' on port 30002 and 'beast' otherwise.
+		Raises ValueError if the string is malformed.
+		"""
+
+		parts = spec.split(':')
+		if len(parts) > 3 or parts[0] == '':
+			raise ValueError(f"Expected host[:port[:format]], got '{spec}'")
+
+		port = int(parts[1]) if len(parts) > 1 else None
+		if len(parts) > 2:
+			fmt = parts[2].lower()
+		else:
+			fmt = 'avr' if port == DEFAULT_PORTS['avr'] else 'beast'
+
+		return cls(parts[0], port, fmt)
+
+	def __str__(self):
+		return f'{self.host}:{self.port} ({self.fmt})'
+
+class FeedMerger:
+	"""Reads several receiver feeds and merges their messages into one tracker.
+
+	Each new message becomes a `Packet` and goes through the same path as locally decoded packets:
+	the packet buffer, the aircraft store, the logger, the output servers and the history store.
+
+	Attributes
+	----------
+	feeds : list(adsb_input.Feed)
+		The feeds being read.
+	dedup : adsb_input.DedupCache
+		The recent messages, used to drop duplicates.
+	merged : int
+		The number of messages passed on to the tracker.
+	duplicates : int
+		The number of messages dropped as copies of a message from another feed.
+	invalid : int
+		The number of messages dropped for failing the CRC check.
+	"""
+
+	def __init__(self, feeds, planes, packets, pos_ref=None, window=1.0, logger=None, outputs=None, history=None, open_connection=asyncio.open_connection, reconnect_delay=5.0, expire_interval=1.0):
+		"""
+		Parameters
+		----------
+		feeds : list(adsb_input.Feed)
+			The feeds to read.
+		planes : adsb_objects.AircraftStore
+			The tracked aircraft.
+		packets : adsb_objects.PacketBuffer
+			The buffer of received packets.
+		pos_ref : list(float), optional
+			The ground station's [latitude, longitude], used to decode surface positions.
+		window : float, optional
+			How long to remember a message when looking for duplicates, in seconds.
+		logger : adsb_logger.PacketLogger, optional
+			Logs every merged packet.
+		outputs : adsb_output.OutputServers, optional
+			Sends every merged packet to the output servers' clients.
+		history : adsb_history.HistoryStore, optional
+			Records every merged packet and position fix.
+		open_connection : coroutine function, optional
+			Opens a feed's connection given its host and port, returning an (asyncio.StreamReader, asyncio.StreamWriter)
+			pair. Replace it to read from something other than TCP, e.g. in tests.
+		reconnect_delay : float, optional
+			How long to wait before reconnecting to a feed that failed or disconnected, in seconds.
+		expire_interval : float, optional
+			How often to remove aircraft we haven't heard from in a while, in seconds.
+		"""
+
+		self.feeds = feeds
+		self.planes = planes
+		self.packets = packets
+		self.pos_ref = pos_ref
+		self.dedup = DedupCache(window)
+		self.logger = logger
+		self.outputs = outputs
+		self.history = history
+		self.reconnect_delay = reconnect_delay
+		self.expire_interval = expire_interval
+		self.merged = 0
+		self.duplicates = 0
+		self.invalid = 0
+
+		self._open_connection = open_connection
+		self._loop = None
+		self._stopping = None
+		self._thread = None
+
+	async def run(self):
+		"""
+		Reads every feed until `stop` is called.
+		"""
+
+		self._loop = asyncio.get_running_loop()
+		self._stopping = asyncio.Event()
+
+		tasks = [ asyncio.ensure_future(self._read(feed)) for feed in self.feeds ]
+		tasks.append(asyncio.ensure_future(self._expire()))
+		try:
+			await self._stopping.wait()
+		finally:
+			for task in tasks:
+				task.cancel()
+			await asyncio.gather(*tasks, return_exceptions=True)
+
+	def start(self):
+		"""
+		Reads every feed on an event loop in a background thread.
+		"""
+		started = threading.Event()
+
+		async def run():
+			task = asyncio.ensure_future(self.run())
+			await asyncio.sleep(0)
+			started.set()
+			await task
+
+		self._thread = threading.Thread(target=asyncio.run, args=(run(),), name='FeedMerger', daemon=True)
+		self._thread.start()
+		started.wait()
+
+	def stop(self):
+		"""
+		Disconnects every feed and stops reading.
+		"""
+		if self._loop != None:
+			self._loop.call_soon_threadsafe(self._stopping.set)
+		if self._thread != None:
+			self._thread.join()
+
+	async def _read(self, feed):
+		"""
+		Reads a feed, reconnecting whenever it fails or disconnects.
+		"""
+
+		while True:
+			try:
+				reader, writer = await self._open_connection(feed.host, feed.port)
+			except OSError as e:
+				print(f"\n*** Error connecting to {feed} - {e} ***")
+				await asyncio.sleep(self.reconnect_delay)
+				continue
+
+			feed.connected = True
+			parser = PARSERS[feed.fmt]()
+			try:
+				while True:
+					data = await reader.read(65536)
+					if not data:
+						break
+					self.receive(feed, parser.feed(data))
+			except ConnectionError as e:
+				print(f"\n*** Lost connection to {feed} - {e} ***")
+			finally:
+				feed.connected = False
+				writer.close()
+
+			await asyncio.sleep(self.reconnect_delay)
+
+	async def _expire(self):
+		"""
+		Periodically removes aircraft we haven't heard from in a while.
+		"""
+		while True:
+			await asyncio.sleep(self.expire_interval)
+			self.planes.expire()
+
+	def receive(self, feed, frames):
+		"""
+		Merges messages received from a feed.
+
+		Parameters
+		----------
+		feed : adsb_input.Feed
+			The feed the messages came from.
+		frames : list of (bytes, int, int)
+			The raw message, signal level (None if unknown) and receiver timestamp of each message, as returned by the feed's parser.
+		"""
+
+		now = time.time()
+		records = []
+		feed.received += len(frames)
+
+		for raw, _, _ in frames:
+			if not is_valid(raw):
+				self.invalid += 1
+				continue
+			if self.dedup.is_duplicate(raw, feed, now):
+				self.duplicates += 1
+				continue
+
+			# The SNR is unknown. Beast receivers such as dump1090 send an RSSI magnitude as the signal level,
+			# which can't be compared with the SNR this tracker measures against its own noise floor.
+			pkt = ao.Packet(raw, now)
+			self.packets.append(pkt)
+			self.merged += 1
+
+			if self.logger != None:
+				self.logger.log(pkt)
+
+			metrics.record_packet(pkt)
+			plane = self.planes.update(pkt, self.pos_ref)
+
+			if self.history != None:
+				self.history.record(pkt, plane)
+
+			if self.outputs != None:
+				records.append((pkt, plane.pos if plane != None else None, None))
+
+		if self.outputs != None:
+			self.outputs.publish(records)
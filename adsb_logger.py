@@ -0,0 +1,218 @@
+import json
+import os
+import queue
+import struct
+import threading
+import time
+
+# Binary record: timestamp (float64), SNR (float32, NaN if unknown), sample offset (int64, -1 if unknown),
+# message length in bytes (uint8) and the message zero-padded to 14 bytes
+BINARY_RECORD = struct.Struct('<dfqB14s')
+
+class PacketLogger:
+	"""Writes decoded packets to a log file from a background thread.
+
+	Packets are queued by the decoder and written in batches, so a slow disk never stalls decoding.
+	If the queue fills up, packets are dropped and counted instead. The log file is rotated once it
+	grows past a size limit or gets older than a time limit, keeping a number of numbered backups
+	(`log.1` is the most recent).
+
+	Formats
+	-------
+	'text' : `[dd/Mon/YYYY HH:MM:SS] <hex message>` lines, as logged by earlier versions.
+	'jsonl' : One JSON object per line with the timestamp, SNR, hex message and sample offset.
+	'binary' : Fixed-size records described by `BINARY_RECORD`. Read them back with `read_binary_log`.
+
+	Attributes
+	----------
+	path : str
+		The log file.
+	fmt : str
+		The log format. One of 'text', 'jsonl' or 'binary'.
+	dropped : int
+		The number of packets dropped because the queue was full.
+	"""
+
+	FORMATS = ('text', 'jsonl', 'binary')
+
+	def __init__(self, path, fmt='text', max_bytes=None, rotate_seconds=None, backups=5, flush_interval=1.0, queue_size=65536):
+		"""
+		Parameters
+		----------
+		path : str
+			The log file. Appended to if it already exists.
+		fmt : str, optional
+			The log format. One of 'text', 'jsonl' or 'binary'.
+		max_bytes : int, optional
+			Rotate the log once it grows past this size. Never rotates by size if unset.
+		rotate_seconds : float, optional
+			Rotate the log once it has been written to for this long. Never rotates by time if unset.
+		backups : int, optional
+			The number of rotated logs to keep.
+		flush_interval : float, optional
+			The maximum number of seconds a packet waits before it is written out.
+		queue_size : int, optional
+			The maximum number of packets waiting to be written.
+		"""
+
+		if fmt not in self.FORMATS:
+			raise ValueError(f"Unknown log format '{fmt}', expected one of {self.FORMATS}")
+
+		self.path = path
+		self.fmt = fmt
+		self.max_bytes = max_bytes
+		self.rotate_seconds = rotate_seconds
+		self.backups = backups
+		self.flush_interval = flush_interval
+		self.dropped = 0
+
+		self._queue = queue.Queue(queue_size)
+		self._file = None
+		self._opened = None
+		self._thread = threading.Thread(target=self._run, name='PacketLogger', daemon=True)
+		self._thread.start()
+
+	def log(self, pkt, offset=None):
+		"""
+		Queues a packet to be written. Never blocks.
+
+		Parameters
+		----------
+		pkt : adsb_objects.Packet
+			The packet to log.
+		offset : int, optional
+			The packet's sample offset in the input stream.
+		"""
+		snr = None if pkt.snr == None else float(pkt.snr)
+		try:
+			self._queue.put_nowait((pkt.timestamp, snr, pkt.raw, offset))
+		except queue.Full:
+			self.dropped += 1
+
+	def close(self):
+		"""
+		Writes out the queued packets and closes the log file.
+		"""
+		# Wake the writer with a sentinel, it stops once everything before it is written.
+		# Only wait for room in the queue while the writer is still there to make some.
+		while self._thread.is_alive():
+			try:
+				self._queue.put(None, timeout=self.flush_interval)
+				break
+			except queue.Full:
+				pass
+		self._thread.join()
+
+	def _run(self):
+		"""
+		Background thread. Writes queued packets in batches until the logger is closed.
+		"""
+		running = True
+		while running:
+			try:
+				batch = [self._queue.get(timeout=self.flush_interval)]
+			except queue.Empty:
+				continue
+
+			# Collect everything else waiting so it's written and flushed at once
+			while True:
+				try:
+					batch.append(self._queue.get_nowait())
+				except queue.Empty:
+					break
+
+			if None in batch:
+				running = False
+				batch = [record for record in batch if record != None]
+
+			# A bad batch is reported and dropped, the writer keeps going
+			try:
+				self._write(batch)
+			except Exception as e:
+				print(f"\n*** Error writing to {self.path} - {e} ***")
+
+		if self._file != None:
+			self._file.close()
+
+	def _write(self, batch):
+		"""
+		Formats and writes a batch of queued packets, rotating the log first if needed.
+		"""
+		if len(batch) == 0:
+			return
+
+		if self._file != None and self._should_rotate():
+			self._rotate()
+
+		if self._file == None:
+			self._file = open(self.path, 'ab' if self.fmt == 'binary' else 'a')
+			self._opened = time.time()
+
+		if self.fmt == 'binary':
+			self._file.write(b''.join(self._format_binary(*record) for record in batch))
+		else:
+			format_line = self._format_text if self.fmt == 'text' else self._format_jsonl
+			self._file.write(''.join(format_line(*record) for record in batch))
+
+		self._file.flush()
+
+	def _should_rotate(self):
+		"""
+		Returns whether the current log file has grown too large or too old.
+		"""
+		if self.max_bytes != None and self._file.tell() >= self.max_bytes:
+			return True
+		if self.rotate_seconds != None and time.time() - self._opened >= self.rotate_seconds:
+			return True
+		return False
+
+	def _rotate(self):
+		"""
+		Closes the current log file and shifts it and its backups up by one number.
+		"""
+		self._file.close()
+		self._file = None
+
+		for i in range(self.backups - 1, 0, -1):
+			if os.path.exists(f"{self.path}.{i}"):
+				os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+
+		if self.backups > 0:
+			os.replace(self.path, f"{self.path}.1")
+		else:
+			os.remove(self.path)
+
+	@staticmethod
+	def _format_text(timestamp, snr, raw, offset):
+		dtg = time.strftime('%d/%b/%Y %H:%M:%S', time.localtime(timestamp))
+		return f"[{dtg}] {raw.hex()}\n"
+
+	@staticmethod
+	def _format_jsonl(timestamp, snr, raw, offset):
+		return json.dumps({ 'timestamp' : timestamp, 'snr' : snr, 'msg' : raw.hex(), 'offset' : None if offset == None else int(offset) }) + '\n'
+
+	@staticmethod
+	def _format_binary(timestamp, snr, raw, offset):
+		return BINARY_RECORD.pack(timestamp, float('nan') if snr == None else snr, -1 if offset == None else offset, len(raw), raw)
+
+def read_binary_log(path):
+	"""
+	Reads back a log written in the 'binary' format.
+
+	Parameters
+	----------
+	path : str
+		The log file.
+
+	Yields
+	------
+	tuple(float, float, str, int)
+		The timestamp, SNR, hex message and sample offset of each packet. SNR is NaN and offset is -1 if unknown.
+	"""
+	with open(path, 'rb') as f:
+		while True:
+			record = f.read(BINARY_RECORD.size)
+			if len(record) < BINARY_RECORD.size:
+				break
+			timestamp, snr, offset, length, raw = BINARY_RECORD.unpack(record)
+			yield timestamp, snr, raw[:length].hex(), offset
@@ -0,0 +1,264 @@
+import threading
+import time
+
+from flask import Response
+
+class Metric:
+	"""A named metric with optional labels.
+
+	Values are kept per tuple of label values. Updates take a lock, so a metric can be shared by
+	several threads, but cost well under a microsecond. A metric can instead be given a function,
+	which is called whenever the metric is read, to expose a value another object already keeps.
+
+	Attributes
+	----------
+	name : str
+		The metric's Prometheus name.
+	help : str
+		A one line description of the metric.
+	labels : tuple(str)
+		The names of the metric's labels.
+	fn : callable
+		Returns the metric's current value, or None if the metric is updated directly.
+	"""
+
+	TYPE = 'untyped'
+	# The value of a metric that hasn't been updated yet
+	INITIAL = 0
+
+	def __init__(self, name, help, labels=(), fn=None):
+		self.name = name
+		self.help = help
+		self.labels = tuple(labels)
+		self.fn = fn
+
+		self._values = {}
+		self._lock = threading.Lock()
+
+	def values(self):
+		"""
+		Returns a dict of (tuple of label values : value) with the metric's current values.
+		"""
+		if self.fn != None:
+			return { () : self.fn() }
+		with self._lock:
+			values = dict(self._values)
+		# Without labels there is one value, reported even before it is first updated
+		if len(values) == 0 and len(self.labels) == 0:
+			values[()] = self.INITIAL
+		return values
+
+	def samples(self):
+		"""
+		Returns the (name suffix, label values, value) of every sample in the Prometheus exposition.
+		"""
+		return [ ('', labels, value) for labels, value in self.values().items() ]
+
+class Counter(Metric):
+	"""A count that only goes up, e.g. of messages received."""
+
+	TYPE = 'counter'
+
+	def inc(self, amount=1, labels=()):
+		"""
+		Adds to the count.
+
+		Parameters
+		----------
+		amount : int or float, optional
+			How much to add.
+		labels : tuple, optional
+			The label values, in the order of the metric's label names.
+		"""
+		with self._lock:
+			self._values[labels] = self._values.get(labels, 0) + amount
+
+class Gauge(Metric):
+	"""A value that goes up and down, e.g. the number of buffered samples."""
+
+	TYPE = 'gauge'
+
+	def set(self, value, labels=()):
+		"""
+		Sets the value.
+		"""
+		with self._lock:
+			self._values[labels] = value
+
+class Timer(Metric):
+	"""Summary of how long something takes: the number of observations and their total in seconds."""
+
+	TYPE = 'summary'
+	INITIAL = (0, 0.0)
+
+	def observe(self, seconds, labels=(), count=1):
+		"""
+		Records a duration.
+
+		Parameters
+		----------
+		seconds : float
+			The duration.
+		labels : tuple, optional
+			The label values, in the order of the metric's label names.
+		count : int, optional
+			The number of observations the duration covers.
+		"""
+		with self._lock:
+			n, total = self._values.get(labels, (0, 0.0))
+			self._values[labels] = (n + count, total + seconds)
+
+	def time(self, labels=()):
+		"""
+		Returns a context manager that records the time spent in its block.
+		"""
+		return _Timing(self, labels)
+
+	def samples(self):
+		samples = []
+		for labels, (n, total) in self.values().items():
+			samples.append(('_count', labels, n))
+			samples.append(('_sum', labels, total))
+		return samples
+
+class _Timing:
+	"""Context manager recording the time spent in its block with a Timer."""
+
+	__slots__ = ('timer', 'labels', 'start')
+
+	def __init__(self, timer, labels):
+		self.timer = timer
+		self.labels = labels
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc):
+		self.timer.observe(time.perf_counter() - self.start, self.labels)
+
+def _format_labels(names, values):
+	"""
+	Formats label values as a Prometheus label set, e.g. `{df="17",typecode="11"}`.
+	"""
+	if len(names) == 0:
+		return ''
+	pairs = []
+	for name, value in zip(names, values):
+		value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+		pairs.append(f'{name}="{value}"')
+	return '{' + ','.join(pairs) + '}'
+
+class Registry:
+	"""A set of metrics, rendered together in the Prometheus text format.
+
+	Metrics are created through the registry. Asking for a name that already exists returns the
+	existing metric, so modules can share metrics without passing them around.
+	"""
+
+	def __init__(self):
+		self._metrics = {}
+		self._lock = threading.Lock()
+
+	def _get(self, cls, name, help, labels, fn=None):
+		with self._lock:
+			metric = self._metrics.get(name)
+			if metric == None:
+				metric = self._metrics[name] = cls(name, help, labels)
+			elif not isinstance(metric, cls):
+				raise ValueError(f"Metric '{name}' is already registered as a {metric.TYPE}")
+			if fn != None:
+				metric.fn = fn
+			return metric
+
+	def counter(self, name, help, labels=(), fn=None):
+		"""
+		Returns the counter with this name, creating it if needed. A given `fn` replaces the counter's function.
+		"""
+		return self._get(Counter, name, help, labels, fn)
+
+	def gauge(self, name, help, labels=(), fn=None):
+		"""
+		Returns the gauge with this name, creating it if needed. A given `fn` replaces the gauge's function.
+		"""
+		return self._get(Gauge, name, help, labels, fn)
+
+	def timer(self, name, help, labels=()):
+		"""
+		Returns the timer with this name, creating it if needed.
+		"""
+		return self._get(Timer, name, help, labels)
+
+	def __iter__(self):
+		with self._lock:
+			return iter(list(self._metrics.values()))
+
+	def get(self, name):
+		"""
+		Returns the metric with this name, or None.
+		"""
+		return self._metrics.get(name)
+
+	def render(self):
+		"""
+		Returns every metric in the Prometheus text exposition format.
+		"""
+		lines = []
+		for metric in self:
+			lines.append(f'# HELP {metric.name} {metric.help}')
+			lines.append(f'# TYPE {metric.name} {metric.TYPE}')
+			for suffix, labels, value in metric.samples():
+				lines.append(f'{metric.name}{suffix}{_format_labels(metric.labels, labels)} {value}')
+		return '\n'.join(lines) + '\n'
+
+	def response(self):
+		"""
+		Returns a Flask response with every metric in the Prometheus text exposition format.
+		"""
+		return Response(self.render(), content_type='text/plain; version=0.0.4; charset=utf-8', headers={ 'Cache-Control' : 'no-cache' })
+
+# The metrics of the running tracker
+REGISTRY = Registry()
+
+# Pipeline stages, in the order samples go through them. 'track' covers everything done with each
+# decoded packet: buffering, logging, counting and updating the aircraft it came from. 'expire' is the TTL sweep.
+STAGES = ('read', 'magnitude', 'detect', 'demodulate', 'crc', 'correct', 'track', 'expire')
+
+STAGE_SECONDS = REGISTRY.timer('adsb_stage_seconds', 'Time spent in each pipeline stage. Decoding stages are summed over the worker processes.', ('stage',))
+CHUNKS = REGISTRY.counter('adsb_chunks_total', 'Chunks of samples processed.')
+DROPPED_CHUNKS = REGISTRY.counter('adsb_chunks_dropped_total', 'Chunks of samples dropped because the ring buffer was full.')
+SAMPLES = REGISTRY.counter('adsb_samples_total', 'Samples processed.')
+PROCESSING_LOAD = REGISTRY.gauge('adsb_processing_load', 'Time taken to process the last chunk over the time its samples span. Above 1 the processor falls behind.')
+CANDIDATES = REGISTRY.counter('adsb_preamble_candidates_total', 'Preamble candidates found.')
+VALID = REGISTRY.counter('adsb_messages_valid_total', 'Candidates that passed the CRC check, including corrected ones.')
+CORRECTED = REGISTRY.counter('adsb_messages_corrected_total', 'Candidates that passed the CRC check after correcting bit errors.')
+MESSAGES = REGISTRY.counter('adsb_messages_total', 'Messages processed by downlink format and ADS-B typecode. The typecode is empty for non-ADS-B messages.', ('df', 'typecode'))
+
+def record_decode(stats):
+	"""
+	Records the statistics gathered by `adsb_signal_processing.decode_chunk`.
+
+	Parameters
+	----------
+	stats : dict
+		The seconds spent in each decoding stage and the 'candidates', 'valid' and 'corrected' counts.
+	"""
+	for stage in ('detect', 'demodulate', 'crc', 'correct'):
+		if stage in stats:
+			STAGE_SECONDS.observe(stats[stage], (stage,))
+	CANDIDATES.inc(stats.get('candidates', 0))
+	VALID.inc(stats.get('valid', 0))
+	CORRECTED.inc(stats.get('corrected', 0))
+
+def record_packet(packet):
+	"""
+	Counts a processed packet by downlink format and typecode.
+	"""
+	typecode = packet.typecode
+	MESSAGES.inc(1, (packet.df, '' if typecode == None else typecode))
+
+def register(server, registry=REGISTRY):
+	"""
+	Serves a registry's metrics in the Prometheus text format on '/metrics' of a Flask server.
+	"""
+	server.add_url_rule('/metrics', 'metrics', registry.response)
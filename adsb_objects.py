@@ -1,10 +1,17 @@
 import numpy as np
 from numpy import *
-import pyModeS as pms
 import time
+import threading
+import heapq
 from datetime import datetime
 import pandas as pd
 
+import adsb_crc as crc
+import adsb_decoder as adsbd
+
+# Marks a lazily computed Packet attribute that has not been worked out yet
+_UNSET = object()
+
 def print_dashboard(planes):
 	"""
 	Prints a table of tracked aircraft to stdout.
@@ -105,64 +112,571 @@ def print_dashboard_fancy(planes):
 class Packet:
 	"""Class to store information and metadata for an ADS-B packet.
 	
+	The message is kept as raw bytes. Its hex string, downlink format, ICAO address and typecode are
+	only worked out when first used, so packets that are just counted or logged stay cheap.
+	
 	Attributes
 	----------
+	raw : bytes
+		The 7 or 14 byte ADS-B message.
 	msg : str
 		The ADS-B message in hex-string format
 	short : bool
 		Whether this packet is a short squitter (True) or a long squitter (False)
 	icao : str
-		The ICAO hex code for packet's transmitter.
+		The ICAO hex code for packet's transmitter, in uppercase.
 	df : int
 		The downlink format of the packet.
 	typecode : int
-		The typecode of the packet.
+		The typecode of the packet. None unless the packet is DF17 or DF18.
 	timestamp : float
 		The Unix timestamp for when this packet was received.
 	snr : float, optional
 		The SNR of this packet in dB - as compared to the calculated noise floor.
 	"""
-
-	msg = None
-	snr = None
-	timestamp = -1
-
-	short = None
-	icao = None
-	df = None
-	typecode = None
+	
+	__slots__ = ('raw', 'timestamp', 'snr', '_icao')
 	
 	def __init__( self, msg, timestamp = None, snr = None):
 		"""		
 		Parameters
 		----------
-		msg : str
-			A valid ADS-B message in hex-string format. Must have already passed a CRC check.
+		msg : str or bytes
+			A valid ADS-B message in hex-string or raw format. Must have already passed a CRC check.
 		timestamp : float, optional
 			The Unix timestamp for when this packet was received. By default, uses the current time.
 		snr : float, optional
 			The calculated SNR value for this packet's signal, in dB as compared to the noise floor.
 		"""
 		
-		self.msg = msg
+		self.raw = bytes.fromhex(msg) if isinstance(msg, str) else bytes(msg)
 		self.timestamp = timestamp if timestamp != None else time.time()
 		self.snr = snr
-		self.short = ( len(msg) <= 14 )
+		self._icao = _UNSET
+	
+	@classmethod
+	def from_batch( cls, msgs, timestamp = None, snrs = None ):
+		"""
+		Create packets for a batch of decoded messages at once.
+		
+		Parameters
+		----------
+		msgs : numpy.array or list(str)
+			A (N, L) uint8 matrix holding one raw message per row, or a list of hex-string messages.
+		timestamp : float or list(float), optional
+			The Unix timestamp for when the messages were received, either shared or one per message. By default, uses the current time.
+		snrs : list(float), optional
+			The SNR of each message in dB.
+		
+		Returns
+		-------
+		list(adsb_objects.Packet)
+			One packet per message.
+		"""
+		
+		if isinstance(msgs, np.ndarray):
+			n_bytes = msgs.shape[1]
+			data = np.ascontiguousarray(msgs, dtype=np.uint8).tobytes()
+			raws = [ data[i : i + n_bytes] for i in range(0, len(data), n_bytes) ]
+		else:
+			raws = [ bytes.fromhex(msg) if isinstance(msg, str) else bytes(msg) for msg in msgs ]
+		
+		if timestamp == None:
+			timestamp = time.time()
+		timestamps = timestamp if isinstance(timestamp, (list, tuple, np.ndarray)) else [timestamp] * len(raws)
+		if snrs is None:
+			snrs = [None] * len(raws)
 		
-		self.icao = pms.adsb.icao( msg )
-		self.df = pms.adsb.df( msg )
-		self.typecode = pms.adsb.typecode( msg )
+		packets = []
+		for raw, t, snr in zip(raws, timestamps, snrs):
+			packet = cls.__new__(cls)
+			packet.raw = raw
+			packet.timestamp = t
+			packet.snr = snr
+			packet._icao = _UNSET
+			packets.append(packet)
+		
+		return packets
+	
+	@property
+	def msg(self):
+		return self.raw.hex()
+	
+	@property
+	def short(self):
+		return len(self.raw) == 7
+	
+	@property
+	def df(self):
+		# Formats 24 and above share the first two bits, pyModeS reports them all as 24
+		df = self.raw[0] >> 3
+		return df if df < 24 else 24
+	
+	@property
+	def icao(self):
+		if self._icao is _UNSET:
+			df = self.df
+			if df in (11, 17, 18):
+				self._icao = self.raw[1:4].hex().upper()
+			elif df in (0, 4, 5, 16, 20, 21):
+				# The address is overlaid on the parity bits, so it is left over as the CRC residual
+				self._icao = f'{crc.crc24(self.raw):06X}'
+			else:
+				self._icao = None
+		
+		return self._icao
+	
+	@property
+	def typecode(self):
+		if self.df not in (17, 18) or len(self.raw) < 5:
+			return None
+		return self.raw[4] >> 3
 	
 	def __repr__(self):
 		return f"<ADSB_Packet msg:{self.msg}>"
 		
 	def __str__(self):
 		dtg = datetime.fromtimestamp(self.timestamp).strftime('%d/%b/%Y %H:%M:%S')
-		return f"[{dtg}] {'Short' if self.short else 'Long'} DF{self.df} ICAO: {self.icao} typecode: {self.typecode} MSG:{self.msg} SNR:{self.snr:.2f}dB"
+		snr = 'unknown' if self.snr == None else f'{self.snr:.2f}dB'
+		return f"[{dtg}] {'Short' if self.short else 'Long'} DF{self.df} ICAO: {self.icao} typecode: {self.typecode} MSG:{self.msg} SNR:{snr}"
+		
+class PacketBuffer:
+	"""Fixed-capacity ring buffer of the most recently received packets.
+	
+	Every appended packet gets the next sequence number, starting at 1. Readers ask for the packets
+	after a sequence number they have already seen, so they only process new packets. Reads take no
+	lock: each slot holds its packet's sequence number, so a slot overwritten while it is being read
+	is recognised and skipped.
+	
+	Attributes
+	----------
+	size : int
+		The maximum number of packets kept.
+	"""
+	
+	def __init__(self, size=256):
+		"""
+		Parameters
+		----------
+		size : int, optional
+			The maximum number of packets kept. At least 1.
+		"""
+		
+		self.size = size if size > 0 else 1
+		self._slots = [None] * self.size
+		self._seq = 0
+		self._write_lock = threading.Lock()
+	
+	def __len__(self):
+		return self._seq if self._seq < self.size else self.size
+	
+	def __iter__(self):
+		return iter(self.since(0)[1])
+	
+	@property
+	def seq(self):
+		"""
+		The sequence number of the newest packet. 0 if no packets were appended yet.
+		"""
+		return self._seq
+	
+	def append(self, packet):
+		"""
+		Adds a packet, overwriting the oldest one if the buffer is full.
+		
+		Parameters
+		----------
+		packet : adsb_objects.Packet
+			The packet to add.
+		
+		Returns
+		-------
+		int
+			The packet's sequence number.
+		"""
+		
+		with self._write_lock:
+			seq = self._seq + 1
+			self._slots[seq % self.size] = (seq, packet)
+			self._seq = seq
+		
+		return seq
+	
+	def since(self, seq, limit=None):
+		"""
+		Returns the packets appended after the given sequence number, oldest first.
+		
+		Parameters
+		----------
+		seq : int
+			The sequence number of the last packet already seen. 0 for all kept packets.
+		limit : int, optional
+			Only return up to this many of the newest packets.
+		
+		Returns
+		-------
+		int
+			The sequence number of the newest packet. Pass it to the next call.
+		list(adsb_objects.Packet)
+			The new packets. Packets that were overwritten before they could be read are skipped.
+		"""
+		
+		head = self._seq
+		start = seq + 1
+		if head - self.size + 1 > start:
+			start = head - self.size + 1
+		if limit != None and head - limit + 1 > start:
+			start = head - limit + 1
+		
+		packets = []
+		for s in range(start, head + 1):
+			entry = self._slots[s % self.size]
+			if entry != None and entry[0] == s:
+				packets.append(entry[1])
+		
+		return head, packets
+	
+	def latest(self, n):
+		"""
+		Returns up to the n newest packets, oldest first.
+		"""
+		return self.since(0, n)[1]
+		
+class PlaneTable:
+	"""Columnar storage for the state of tracked aircraft.
+	
+	Each aircraft owns a slot, one row across a set of preallocated arrays. Numeric columns are
+	float64 arrays holding NaN for unknown values, so the dashboard can read every aircraft's position
+	at once. Released slots are reused, and the arrays double in size when every slot is taken.
+	
+	Attributes
+	----------
+	capacity : int
+		The number of slots in the arrays.
+	slots : dict of (str : int)
+		Maps each tracked ICAO address to its slot.
+	icao, callsign : numpy.array
+		Object columns of ICAO addresses and callsigns. None where unknown.
+	lat, lon, altitude, velocity, heading, last_update : numpy.array
+		Float columns of each aircraft's state. NaN where unknown.
+	used : numpy.array
+		Boolean column of the slots in use.
+	"""
+	
+	OBJECT_COLUMNS = ('icao', 'callsign')
+	NUMERIC_COLUMNS = ('lat', 'lon', 'altitude', 'velocity', 'heading', 'last_update')
+	
+	def __init__(self, capacity=64):
+		"""
+		Parameters
+		----------
+		capacity : int, optional
+			The initial number of slots.
+		"""
+		
+		self.capacity = 0
+		self.slots = {}
+		
+		for name in self.OBJECT_COLUMNS:
+			setattr(self, name, np.empty(0, dtype=object))
+		for name in self.NUMERIC_COLUMNS:
+			setattr(self, name, np.empty(0))
+		self.used = np.empty(0, dtype=bool)
+		
+		self._free = []
+		self._grow(capacity if capacity > 0 else 1)
+	
+	def __len__(self):
+		return self.capacity - len(self._free)
+	
+	def _grow(self, capacity):
+		"""
+		Extends every column to the given number of slots.
+		"""
+		
+		n = capacity - self.capacity
+		for name in self.OBJECT_COLUMNS:
+			setattr(self, name, np.concatenate([getattr(self, name), np.full(n, None, dtype=object)]))
+		for name in self.NUMERIC_COLUMNS:
+			setattr(self, name, np.concatenate([getattr(self, name), np.full(n, np.nan)]))
+		self.used = np.concatenate([self.used, np.zeros(n, dtype=bool)])
+		
+		# Hand out the lowest slots first
+		self._free.extend(range(capacity - 1, self.capacity - 1, -1))
+		self.capacity = capacity
+	
+	def allocate(self, icao=None):
+		"""
+		Takes a free slot and clears it, growing the table if it is full.
+		
+		Parameters
+		----------
+		icao : str, optional
+			The ICAO address of the aircraft using the slot.
+		
+		Returns
+		-------
+		int
+			The slot.
+		"""
+		
+		if len(self._free) == 0:
+			self._grow(2 * self.capacity)
+		
+		slot = self._free.pop()
+		for name in self.OBJECT_COLUMNS:
+			getattr(self, name)[slot] = None
+		for name in self.NUMERIC_COLUMNS:
+			getattr(self, name)[slot] = np.nan
+		self.used[slot] = True
+		
+		if icao != None:
+			self.set_icao(slot, icao)
+		
+		return slot
+	
+	def release(self, slot):
+		"""
+		Frees a slot for reuse.
+		"""
+		
+		icao = self.icao[slot]
+		if self.slots.get(icao) == slot:
+			del self.slots[icao]
+		
+		self.icao[slot] = None
+		self.callsign[slot] = None
+		self.used[slot] = False
+		self._free.append(slot)
+	
+	def set_icao(self, slot, icao):
+		"""
+		Sets the ICAO address of a slot and indexes the slot by it.
+		"""
+		
+		self.icao[slot] = icao
+		if icao != None:
+			self.slots[icao] = slot
+	
+	def columns(self, slots=None):
+		"""
+		Returns a copy of the columns for the given slots.
+		
+		Parameters
+		----------
+		slots : numpy.array, optional
+			The slots to copy. By default, every slot in use.
+		
+		Returns
+		-------
+		dict of (str : numpy.array)
+			Each column's values for the slots, in slot order.
+		"""
+		
+		if slots is None:
+			slots = np.flatnonzero(self.used)
+		
+		return { name : getattr(self, name)[slots] for name in self.OBJECT_COLUMNS + self.NUMERIC_COLUMNS }
+	
+# Number of positions kept in each plane's trail
+TRAIL_SIZE = 256
+# How far, in degrees of latitude, a simplified trail may stray from the positions it replaces. About 100m.
+TRAIL_TOLERANCE = 0.001
+
+def simplify(lat, lon, tolerance=TRAIL_TOLERANCE):
+	"""
+	Simplifies a polyline with the Douglas-Peucker algorithm.
+	
+	Longitudes are scaled by the cosine of the mean latitude, so the tolerance is about the same
+	distance in every direction.
+	
+	Parameters
+	----------
+	lat, lon : numpy.array
+		The latitude and longitude of each point, in order.
+	tolerance : float, optional
+		The largest distance, in degrees of latitude, a dropped point may be from the simplified line.
+	
+	Returns
+	-------
+	numpy.array
+		Boolean mask of the points to keep. The first and last points are always kept.
+	"""
+	
+	n = len(lat)
+	keep = np.zeros(n, dtype=bool)
+	if n == 0:
+		return keep
+	keep[0] = keep[-1] = True
+	
+	x = lon * np.cos(np.radians(np.mean(lat)))
+	y = lat
+	
+	# Spans between two kept points that may still hold points to keep
+	spans = [(0, n - 1)]
+	while spans:
+		first, last = spans.pop()
+		if last - first < 2:
+			continue
+		
+		dx = x[last] - x[first]
+		dy = y[last] - y[first]
+		px = x[first+1:last] - x[first]
+		py = y[first+1:last] - y[first]
+		
+		length = np.hypot(dx, dy)
+		if length > 0:
+			distance = np.abs(px * dy - py * dx) / length
+		else:
+			distance = np.hypot(px, py)
+		
+		i = np.argmax(distance)
+		if distance[i] > tolerance:
+			mid = first + 1 + i
+			keep[mid] = True
+			spans.append((first, mid))
+			spans.append((mid, last))
+	
+	return keep
+
+class Trail:
+	"""Ring of a plane's most recent positions.
+	
+	The positions are kept in a fixed-size (size, 4) float64 array of (timestamp, latitude, longitude,
+	altitude) rows, so a trail never takes more than 32 bytes per position, 8KiB at the default size.
+	The array is only allocated once the first position arrives. The simplified polyline drawn on the
+	map is cached until the next position is added.
+	
+	Attributes
+	----------
+	size : int
+		The most positions kept. The oldest position is overwritten once the ring is full.
+	added : int
+		The number of positions ever added.
+	"""
+	
+	__slots__ = ('size', 'added', '_points', '_simplified')
+	
+	def __init__(self, size=TRAIL_SIZE):
+		self.size = size
+		self.added = 0
+		self._points = None
+		self._simplified = None # (added, tolerance, lat, lon)
+	
+	def __len__(self):
+		return self.added if self.added < self.size else self.size
+	
+	def append(self, timestamp, lat, lon, altitude=None):
+		"""
+		Adds a position, overwriting the oldest one if the ring is full.
+		
+		Parameters
+		----------
+		timestamp : float
+			The Unix timestamp of the position.
+		lat, lon : float
+			The position.
+		altitude : float, optional
+			The altitude in feet. NaN if unknown.
+		"""
+		
+		if self._points is None:
+			self._points = np.empty((self.size, 4))
+		
+		self._points[self.added % self.size] = (timestamp, lat, lon, np.nan if altitude == None else altitude)
+		self.added += 1
+	
+	def points(self):
+		"""
+		Returns a copy of the kept positions as a (n, 4) array of (timestamp, latitude, longitude, altitude) rows, oldest first.
+		"""
+		
+		if self.added <= self.size:
+			return self._points[:self.added].copy() if self._points is not None else np.empty((0, 4))
+		
+		head = self.added % self.size
+		return np.concatenate([self._points[head:], self._points[:head]])
+	
+	def latest(self):
+		"""
+		Returns the newest position as a (timestamp, latitude, longitude, altitude) array, or None if there is none.
+		"""
+		
+		if self.added == 0:
+			return None
+		return self._points[(self.added - 1) % self.size].copy()
+	
+	def simplified(self, tolerance=TRAIL_TOLERANCE):
+		"""
+		Returns the trail simplified with the Douglas-Peucker algorithm. Only recomputed after new positions arrive.
+		
+		Parameters
+		----------
+		tolerance : float, optional
+			The largest distance, in degrees of latitude, a dropped position may be from the simplified line.
+		
+		Returns
+		-------
+		numpy.array
+			The latitudes of the simplified trail, oldest first.
+		numpy.array
+			The longitudes of the simplified trail, oldest first.
+		"""
+		
+		cached = self._cached(tolerance)
+		if cached != None:
+			return cached
+		return self._simplify(self.added, self.points(), tolerance)
+	
+	def _cached(self, tolerance):
+		"""
+		Returns the cached simplified (latitudes, longitudes) if no position was added since, or None.
+		"""
+		cached = self._simplified
+		if cached != None and cached[0] == self.added and cached[1] == tolerance:
+			return cached[2], cached[3]
+		return None
+	
+	def _simplify(self, added, points, tolerance):
+		"""
+		Simplifies a copy of the positions, taken once `added` positions had been added, and caches the result.
+		Doesn't touch the ring, so it can run while positions are being added.
+		"""
+		keep = simplify(points[:, 1], points[:, 2], tolerance)
+		lat, lon = points[keep, 1], points[keep, 2]
+		
+		self._simplified = (added, tolerance, lat, lon)
+		return lat, lon
+	
+class _Column:
+	"""Plane attribute stored in a column of the plane's PlaneTable."""
+	
+	def __init__(self, name, cast=None):
+		self.name = name
+		self.cast = cast
+	
+	def __get__(self, plane, owner):
+		if plane is None:
+			return self
+		
+		value = getattr(plane.table, self.name)[plane.slot]
+		if self.cast == None:
+			return value
 		
+		# NaN marks an unknown value
+		return None if value != value else self.cast(value)
+	
+	def __set__(self, plane, value):
+		if value == None and self.cast != None:
+			value = np.nan
+		getattr(plane.table, self.name)[plane.slot] = value
+	
 class Plane:
 	"""Class to store information for a tracked aircraft.
 	
+	The plane's state lives in a slot of a PlaneTable; the plane itself only holds the table and slot.
+	Planes tracked by an AircraftStore share the store's table. Otherwise each plane gets its own.
+	
 	Attributes
 	----------
 	icao : str
@@ -181,21 +695,50 @@ class Plane:
 		The nearby reference position to calculate the plane's position with, stored as [latitude, longitude].
 	last_update : float
 		The Unix timestamp of the last packet received from this object.
+	table : adsb_objects.PlaneTable
+		The table holding this plane's state.
+	slot : int
+		This plane's slot in the table.
+	trail : adsb_objects.Trail
+		The plane's most recent positions.
 	"""
-
-	icao = None
-	callsign = None
-	altitude = None
-	velocity = None
-	heading = None
-	pos = [None, None]
-	pos_ref = [None, None]
-	last_update = None
-	
-	def __init__(self, packet=None, pos_ref=[None, None]):
+	
+	__slots__ = ('table', 'slot', 'pos_ref', 'trail', '_cpr', '_pos_time')
+	
+	callsign = _Column('callsign')
+	altitude = _Column('altitude', int)
+	velocity = _Column('velocity', float)
+	heading = _Column('heading', float)
+	last_update = _Column('last_update', float)
+	
+	def __init__(self, packet=None, pos_ref=[None, None], table=None, trail_size=TRAIL_SIZE):
+		self.table = table if table != None else PlaneTable(1)
+		self.slot = self.table.allocate()
 		self.pos_ref = pos_ref
+		self.trail = Trail(trail_size)
+		self._cpr = [None, None] # Last even and odd (CPR latitude, CPR longitude, timestamp, surface) frames
+		self._pos_time = None
 		if packet != None:
 			self.process_packet( packet )
+	
+	@property
+	def icao(self):
+		return self.table.icao[self.slot]
+	
+	@icao.setter
+	def icao(self, icao):
+		self.table.set_icao(self.slot, icao)
+	
+	@property
+	def pos(self):
+		lat = self.table.lat[self.slot]
+		lon = self.table.lon[self.slot]
+		return [None if lat != lat else float(lat), None if lon != lon else float(lon)]
+	
+	@pos.setter
+	def pos(self, pos):
+		self.table.lat[self.slot] = np.nan if pos[0] == None else pos[0]
+		self.table.lon[self.slot] = np.nan if pos[1] == None else pos[1]
 		
 	def __repr__(self):
 		return f"<ADSB_Object icao:{self.icao}>"
@@ -285,35 +828,276 @@ class Plane:
 			The ADS-B packet to process.
 		"""
 		
+		if packet.typecode == None:
+			return
+		
+		msg = adsbd.to_int( packet.raw )
+		
 		# Process callsign
 		if packet.typecode >= 1 and packet.typecode <= 4:
-			self.callsign = pms.adsb.callsign( packet.msg )
+			self.callsign = adsbd.callsign( msg )
 		
 		# Process surface information
 		elif packet.typecode >= 5 and packet.typecode <= 8:
-			self.altitude = pms.adsb.altitude( packet.msg )
-			self.pos = pms.adsb.position_with_ref( packet.msg, self.pos_ref[0], self.pos_ref[1] )
-			self.velocity = pms.adsb.velocity( packet.msg )[0]
-			self.heading = pms.adsb.velocity( packet.msg )[1]
+			self.altitude = 0
+			self.update_position( msg, packet.timestamp, surface=True )
+			self.velocity, self.heading = adsbd.surface_velocity( msg )
 		
 		# Process airborne information
-		elif packet.typecode >= 9 and packet.typecode <= 18:	
-			self.altitude = pms.adsb.altitude( packet.msg )
-			self.pos = pms.adsb.position_with_ref( packet.msg, self.pos_ref[0], self.pos_ref[1] )
+		elif (packet.typecode >= 9 and packet.typecode <= 18) or (packet.typecode >= 20 and packet.typecode <= 22):
+			self.altitude = adsbd.altitude( msg )
+			self.update_position( msg, packet.timestamp )
 						
 		# Process velocity and heading information
 		elif packet.df == 17 and packet.typecode == 19:		
-			self.velocity = pms.adsb.velocity( packet.msg )[0]
-			self.heading = pms.adsb.velocity( packet.msg )[1]
+			self.velocity, self.heading, _ = adsbd.velocity( msg )
+	
+	def update_position(self, msg, timestamp, surface=False):
+		"""
+		Decode the CPR position in a position message and use it to update the plane's position.
+		
+		A position is first decoded globally, from an even and an odd frame received close together.
+		After that, each frame is decoded locally relative to the last known position.
+		Surface frames are decoded with the ground station's position until a pair is available.
 		
+		Parameters
+		----------
+		msg : int
+			The 112-bit airborne or surface position message.
+		timestamp : float
+			The Unix timestamp for when the message was received.
+		surface : bool, optional
+			Whether the message is a surface position message.
+		"""
+		
+		odd, lat_cpr, lon_cpr = adsbd.cpr( msg )
+		self._cpr[odd] = ( lat_cpr, lon_cpr, timestamp, surface )
+		
+		pos = None
+		last_pos = self.pos
+		even_frame, odd_frame = self._cpr
+		
+		if last_pos[0] != None and timestamp - self._pos_time <= adsbd.CPR_LOCAL_MAX_AGE:
+			pos = adsbd.position_with_ref( odd, lat_cpr, lon_cpr, last_pos[0], last_pos[1], surface )
+		
+		elif even_frame != None and odd_frame != None and even_frame[3] == odd_frame[3] \
+			and abs(even_frame[2] - odd_frame[2]) <= adsbd.CPR_PAIR_MAX_AGE:
+			if not surface:
+				pos = adsbd.airborne_position( even_frame[:2], odd_frame[:2], odd == 1 )
+			elif self.pos_ref[0] != None:
+				pos = adsbd.surface_position( even_frame[:2], odd_frame[:2], odd == 1, self.pos_ref[0], self.pos_ref[1] )
+		
+		elif surface and self.pos_ref[0] != None:
+			pos = adsbd.position_with_ref( odd, lat_cpr, lon_cpr, self.pos_ref[0], self.pos_ref[1], surface )
+		
+		if pos != None:
+			self.pos = pos
+			self._pos_time = timestamp
+			self.trail.append(timestamp, pos[0], pos[1], self.table.altitude[self.slot])
+		
+class AircraftStore:
+	"""Thread-safe map of ICAO address to tracked Plane, with expiry of planes that went quiet.
+	
+	Planes are kept in a heap ordered by the time they were last heard from, so expiring them only
+	touches the planes that are due. A plane's heap entry is not moved when it is updated; once the
+	entry reaches the top of the heap it is pushed back with the plane's newer time instead.
+	
+	The planes' state is kept in one shared PlaneTable. Every change increments `version`. Readers such
+	as the dashboard take a columnar `snapshot`, which is copied once per version and shared until the
+	next change. The simplified `trails` are cached the same way.
+	
+	Attributes
+	----------
+	ttl : float
+		Planes not heard from for this many seconds are removed by `expire`.
+	pos_ref : list(float)
+		The reference position given to new planes, stored as [latitude, longitude].
+	version : int
+		Incremented every time a plane is added, updated or removed.
+	table : adsb_objects.PlaneTable
+		The state of every tracked plane.
+	trail_size : int
+		The number of positions kept in each plane's trail.
+	"""
+	
+	def __init__(self, ttl=100, pos_ref=[None, None], trail_size=TRAIL_SIZE):
+		"""
+		Parameters
+		----------
+		ttl : float, optional
+			Planes not heard from for this many seconds are removed by `expire`.
+		pos_ref : list(float), optional
+			The reference position given to new planes, stored as [latitude, longitude].
+		trail_size : int, optional
+			The number of positions kept in each plane's trail.
+		"""
+		
+		self.ttl = ttl
+		self.pos_ref = pos_ref
+		self.trail_size = trail_size
+		self.version = 0
+		
+		self.table = PlaneTable()
+		
+		self._planes = {}
+		self._expiry = [] # (last_update when pushed, icao)
+		self._lock = threading.Lock()
+		self._snapshot = None
+		self._trails = None
+	
+	def __len__(self):
+		return len(self._planes)
+	
+	def __contains__(self, icao):
+		return icao in self._planes
+	
+	def get(self, icao):
+		"""
+		Returns the plane with the given ICAO address, or None if it is not tracked.
+		"""
+		return self._planes.get(icao)
+	
+	def values(self):
+		"""
+		Returns a list of the tracked planes.
+		"""
+		with self._lock:
+			return list(self._planes.values())
+	
+	def update(self, packet, pos_ref=None):
+		"""
+		Processes a packet with the plane that sent it, tracking a new plane if needed.
+		
+		Parameters
+		----------
+		packet : adsb_objects.Packet
+			The ADS-B packet to process.
+		pos_ref : list(float), optional
+			The reference position for a new plane. Uses the store's `pos_ref` if unset.
+		
+		Returns
+		-------
+		adsb_objects.Plane
+			The updated plane, or None if the packet has no ICAO address.
+		"""
+		
+		if packet.icao == None:
+			return None
+		
+		with self._lock:
+			plane = self._planes.get(packet.icao)
+			if plane != None:
+				plane.process_packet( packet )
+			else:
+				plane = Plane( packet, pos_ref if pos_ref != None else self.pos_ref, self.table, self.trail_size )
+				self._planes[packet.icao] = plane
+				heapq.heappush(self._expiry, (plane.last_update, packet.icao))
+			
+			self.version += 1
+		
+		return plane
+	
+	def expire(self, now=None):
+		"""
+		Removes the planes that have not been heard from for `ttl` seconds.
+		
+		Parameters
+		----------
+		now : float, optional
+			The current Unix timestamp. By default, uses the current time.
+		
+		Returns
+		-------
+		list(str)
+			The ICAO addresses of the removed planes.
+		"""
+		
+		cutoff = (now if now != None else time.time()) - self.ttl
+		expired = []
+		
+		with self._lock:
+			while self._expiry and self._expiry[0][0] <= cutoff:
+				last_update, icao = heapq.heappop(self._expiry)
+				plane = self._planes.get(icao)
+				if plane == None:
+					continue
+				
+				# Heard from since the entry was pushed, check again at its new expiry time
+				if plane.last_update > last_update:
+					heapq.heappush(self._expiry, (plane.last_update, icao))
+					continue
+				
+				del self._planes[icao]
+				self.table.release(plane.slot)
+				expired.append(icao)
+			
+			if expired:
+				self.version += 1
+		
+		return expired
+	
+	def snapshot(self):
+		"""
+		Returns a consistent copy of every tracked plane's information.
 		
+		Returns
+		-------
+		int
+			The version the copy was taken at.
+		dict of (str : numpy.array)
+			The 'icao', 'callsign', 'lat', 'lon', 'altitude', 'velocity', 'heading' and 'last_update' columns,
+			one entry per plane. Unknown values are None in the object columns and NaN in the others.
+		"""
 		
+		snapshot = self._snapshot
+		if snapshot != None and snapshot[0] == self.version:
+			return snapshot
 		
+		with self._lock:
+			snapshot = (self.version, self.table.columns())
+			self._snapshot = snapshot
 		
+		return snapshot
+	
+	def trails(self):
+		"""
+		Returns the simplified trail of every tracked plane with at least two positions.
 		
+		The result is cached until the next change, and each plane's simplified trail until it gets a new
+		position, so only the trails of planes that moved are simplified again. The store is only locked
+		while their positions are copied, not while they are simplified.
 		
+		Returns
+		-------
+		int
+			The version the trails were taken at.
+		dict of (str : (numpy.array, numpy.array))
+			The latitudes and longitudes of each plane's simplified trail, oldest first, by ICAO address.
+		"""
 		
+		trails = self._trails
+		if trails != None and trails[0] == self.version:
+			return trails
 		
+		# Only copy the positions of the trails that moved while holding the lock. They are simplified
+		# after releasing it, so the decode thread never waits on the simplification.
+		current = {}
+		moved = []
+		with self._lock:
+			version = self.version
+			for icao, plane in self._planes.items():
+				trail = plane.trail
+				if len(trail) < 2:
+					continue
+				cached = trail._cached(TRAIL_TOLERANCE)
+				if cached != None:
+					current[icao] = cached
+				else:
+					moved.append((icao, trail, trail.added, trail.points()))
 		
+		for icao, trail, added, points in moved:
+			current[icao] = trail._simplify(added, points, TRAIL_TOLERANCE)
 		
-		
\ No newline at end of file
+		trails = (version, current)
+		self._trails = trails
+		return trails
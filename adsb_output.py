@@ -0,0 +1,358 @@
+"""
+TCP output servers feeding decoded traffic to other tools, in the formats dump1090 uses:
+
+'sbs' : BaseStation (SBS-1) CSV lines, usually on port 30003.
+'beast' : Beast binary frames with a 12MHz timestamp and signal level, usually on port 30005.
+'avr' : Raw AVR hex lines (`*8D4840D6...;`), usually on port 30002.
+
+The servers run on an asyncio event loop in a background thread. The decoder hands each chunk's
+packets over without waiting, and every client has a bounded send buffer. A client that cannot keep
+up is disconnected instead of slowing down the decoder or the other clients.
+"""
+
+import asyncio
+import struct
+import threading
+import time
+from collections import deque
+
+import adsb_decoder as adsbd
+
+DEFAULT_PORTS = { 'sbs' : 30003, 'beast' : 30005, 'avr' : 30002 }
+
+def format_avr(packet, pos=None, offset=None):
+	"""
+	Formats a packet as a raw AVR line.
+	"""
+	return b'*' + packet.raw.hex().upper().encode() + b';\n'
+
+def format_beast(packet, pos=None, offset=None):
+	"""
+	Formats a packet as a Beast binary frame.
+
+	The timestamp counts 12MHz ticks from the start of the sample stream, 6 per sample at 2MHz. It is 0 if the offset is unknown.
+	The signal level byte holds the SNR in dB times 4, capped at 255.
+	"""
+
+	frame_type = b'2' if len(packet.raw) == 7 else b'3'
+	ticks = (int(offset) * 6) & 0xFFFFFFFFFFFF if offset != None else 0
+	level = 0 if packet.snr == None else max(0, min(255, int(packet.snr * 4)))
+
+	payload = ticks.to_bytes(6, 'big') + struct.pack('B', level) + packet.raw
+
+	# 0x1A starts a frame, so it is doubled inside one
+	return b'\x1a' + frame_type + payload.replace(b'\x1a', b'\x1a\x1a')
+
+def _whole(value):
+	"""
+	Rounds a number for an SBS field. Unknown values are left empty.
+	"""
+	return '' if value == None or value == '' else round(value)
+
+def format_sbs(packet, pos=None, offset=None):
+	"""
+	Formats a packet as a BaseStation (SBS-1) MSG line.
+
+	Identification, surface position, airborne position, airborne velocity and all-call replies are
+	supported. Returns an empty string for other packets.
+
+	Parameters
+	----------
+	packet : adsb_objects.Packet
+		The packet to format.
+	pos : list(float), optional
+		The decoded [latitude, longitude] of the sending aircraft. Included in position messages.
+	offset : int, optional
+		Unused.
+	"""
+
+	callsign = altitude = speed = track = lat = lon = vertical_rate = on_ground = ''
+
+	df = packet.df
+	if df == 11:
+		transmission = 8
+
+	elif df in (17, 18):
+		tc = packet.typecode
+		msg = adsbd.to_int( packet.raw )
+
+		if tc >= 1 and tc <= 4:
+			transmission = 1
+			callsign = adsbd.callsign( msg ).rstrip('_')
+
+		elif tc >= 5 and tc <= 8:
+			transmission = 2
+			speed, track = adsbd.surface_velocity( msg )
+			on_ground = '-1'
+
+		elif (tc >= 9 and tc <= 18) or (tc >= 20 and tc <= 22):
+			transmission = 3
+			altitude = adsbd.altitude( msg )
+			on_ground = '0'
+
+		elif tc == 19:
+			transmission = 4
+			speed, track, vertical_rate = adsbd.velocity( msg )
+
+		else:
+			return b''
+
+		if transmission in (2, 3) and pos != None and pos[0] != None:
+			lat = f'{pos[0]:.5f}'
+			lon = f'{pos[1]:.5f}'
+
+	else:
+		return b''
+
+	t = time.localtime(packet.timestamp)
+	date = time.strftime('%Y/%m/%d', t)
+	clock = time.strftime('%H:%M:%S', t) + f'.{int(packet.timestamp % 1 * 1000):03d}'
+
+	fields = ['MSG', transmission, 1, 1, packet.icao, 1, date, clock, date, clock, callsign,
+			  _whole(altitude), _whole(speed), _whole(track), lat, lon, _whole(vertical_rate), '', '', '', '', on_ground]
+
+	return (','.join(map(str, fields)) + '\r\n').encode()
+
+FORMATTERS = { 'sbs' : format_sbs, 'beast' : format_beast, 'avr' : format_avr }
+
+class _Client:
+	"""A connected client and the data waiting to be sent to it."""
+
+	def __init__(self, writer):
+		self.writer = writer
+		self.task = asyncio.current_task()
+		self.pending = deque()
+		self.pending_bytes = 0
+		self.wake = asyncio.Event()
+
+class OutputServer:
+	"""TCP server sending every packet to its clients in one format.
+
+	Attributes
+	----------
+	fmt : str
+		The output format. One of 'sbs', 'beast' or 'avr'.
+	port : int
+		The listening port. Set once the server is started, so a port of 0 picks a free port.
+	buffer_bytes : int
+		The amount of unsent data a client may fall behind by before it is disconnected.
+	sent : int
+		The number of bytes queued for clients.
+	dropped : int
+		The number of clients disconnected for falling behind.
+	errors : int
+		The number of packets that could not be formatted and were left out.
+	"""
+
+	def __init__(self, fmt, host='0.0.0.0', port=None, buffer_bytes=1 << 20):
+		"""
+		Parameters
+		----------
+		fmt : str
+			The output format. One of 'sbs', 'beast' or 'avr'.
+		host : str, optional
+			The address to listen on.
+		port : int, optional
+			The port to listen on. Default to the usual port for the format.
+		buffer_bytes : int, optional
+			The amount of unsent data a client may fall behind by before it is disconnected.
+		"""
+
+		if fmt not in FORMATTERS:
+			raise ValueError(f"Unknown output format '{fmt}', expected one of {tuple(FORMATTERS)}")
+
+		self.fmt = fmt
+		self.format = FORMATTERS[fmt]
+		self.host = host
+		self.port = port if port != None else DEFAULT_PORTS[fmt]
+		self.buffer_bytes = buffer_bytes
+		self.sent = 0
+		self.dropped = 0
+		self.errors = 0
+
+		self._clients = {}
+		self._server = None
+
+	def __len__(self):
+		"""
+		Returns the number of connected clients.
+		"""
+		return len(self._clients)
+
+	async def start(self):
+		"""
+		Starts listening for clients.
+		"""
+		self._server = await asyncio.start_server(self._handle, self.host, self.port)
+		self.port = self._server.sockets[0].getsockname()[1]
+
+	async def close(self):
+		"""
+		Stops listening and disconnects every client.
+		"""
+		if self._server != None:
+			self._server.close()
+
+		# Closing a client's connection ends its read loop, letting its handler finish
+		tasks = [ client.task for client in self._clients.values() ]
+		for client in list(self._clients.values()):
+			self._disconnect(client)
+		await asyncio.gather(*tasks, return_exceptions=True)
+
+		if self._server != None:
+			await self._server.wait_closed()
+
+	def encode(self, records):
+		"""
+		Formats packets for the clients. A packet that cannot be formatted is left out and counted in `errors`,
+		and the first such error is printed, so one bad packet never costs the rest of the batch.
+		
+		Parameters
+		----------
+		records : list of (adsb_objects.Packet, list(float), int)
+			Each packet, the decoded [latitude, longitude] of the sending aircraft and the packet's sample offset in the input stream.
+		
+		Returns
+		-------
+		bytes
+			The formatted packets.
+		"""
+		
+		chunks = []
+		for record in records:
+			try:
+				chunks.append(self.format(*record))
+			except Exception as e:
+				if self.errors == 0:
+					print(f"\n*** Error formatting {record[0]!r} for {self.fmt} output - {e!r} ***")
+				self.errors += 1
+		return b''.join(chunks)
+	
+	def broadcast(self, data):
+		"""
+		Queues data for every client. Must be called on the event loop.
+		"""
+
+		if len(data) == 0:
+			return
+
+		for client in list(self._clients.values()):
+			if client.pending_bytes + len(data) > self.buffer_bytes:
+				self.dropped += 1
+				self._disconnect(client)
+				continue
+
+			client.pending.append(data)
+			client.pending_bytes += len(data)
+			client.wake.set()
+			self.sent += len(data)
+
+	async def _handle(self, reader, writer):
+		"""
+		Serves one client until it disconnects or is dropped.
+		"""
+
+		client = _Client(writer)
+		self._clients[writer] = client
+		sender = asyncio.ensure_future(self._send(client))
+
+		try:
+			# Clients have nothing to say, reading only tells us when they hang up
+			while await reader.read(4096):
+				pass
+		except ConnectionError:
+			pass
+		finally:
+			sender.cancel()
+			await asyncio.gather(sender, return_exceptions=True)
+			self._disconnect(client)
+
+	async def _send(self, client):
+		"""
+		Writes a client's queued data as it arrives.
+		"""
+
+		try:
+			while True:
+				await client.wake.wait()
+				client.wake.clear()
+
+				data = b''.join(client.pending)
+				client.pending.clear()
+				client.writer.write(data)
+				await client.writer.drain()
+				client.pending_bytes -= len(data)
+		except ConnectionError:
+			self._disconnect(client)
+
+	def _disconnect(self, client):
+		"""
+		Forgets a client and closes its connection, discarding any unsent data.
+		"""
+		if self._clients.pop(client.writer, None) != None:
+			# close() would wait for the send buffer to flush, which a stalled client never does
+			client.writer.transport.abort()
+
+class OutputServers:
+	"""Runs a set of output servers on an asyncio event loop in a background thread.
+
+	Attributes
+	----------
+	servers : list(adsb_output.OutputServer)
+		The servers, one per output format.
+	"""
+
+	def __init__(self, ports, host='0.0.0.0', buffer_bytes=1 << 20):
+		"""
+		Parameters
+		----------
+		ports : dict of (str : int)
+			The port to serve each output format on, e.g. { 'sbs' : 30003 }. A port of 0 picks a free port.
+		host : str, optional
+			The address to listen on.
+		buffer_bytes : int, optional
+			The amount of unsent data a client may fall behind by before it is disconnected.
+		"""
+
+		self.servers = [ OutputServer(fmt, host, port, buffer_bytes) for fmt, port in ports.items() ]
+
+		self._loop = asyncio.new_event_loop()
+		self._thread = threading.Thread(target=self._loop.run_forever, name='OutputServers', daemon=True)
+
+	def start(self):
+		"""
+		Starts the event loop and every server. Raises OSError if a port cannot be used.
+		"""
+		self._thread.start()
+		for server in self.servers:
+			asyncio.run_coroutine_threadsafe(server.start(), self._loop).result()
+
+	def close(self):
+		"""
+		Stops every server and the event loop.
+		"""
+		for server in self.servers:
+			asyncio.run_coroutine_threadsafe(server.close(), self._loop).result()
+		self._loop.call_soon_threadsafe(self._loop.stop)
+		self._thread.join()
+
+	def publish(self, records):
+		"""
+		Sends packets to the clients of every server. Never blocks; formatting and sending happen on the event loop.
+
+		Parameters
+		----------
+		records : list of (adsb_objects.Packet, list(float), int)
+			Each packet, the decoded [latitude, longitude] of the sending aircraft and the packet's sample offset in the input stream.
+		"""
+
+		if len(records) > 0 and any(len(server) > 0 for server in self.servers):
+			self._loop.call_soon_threadsafe(self._broadcast, records)
+
+	def _broadcast(self, records):
+		"""
+		Formats the packets once per format and queues them for the clients. Runs on the event loop.
+		"""
+		for server in self.servers:
+			if len(server) > 0:
+				server.broadcast(server.encode(records))
@@ -0,0 +1,172 @@
+import numpy as np
+import threading
+from collections import deque
+
+class SampleRingBuffer:
+	"""Bounded ring buffer carrying RF samples from a reader thread to a processing thread.
+
+	Samples are stored in a preallocated array. Each read returns the next block of samples
+	prefixed with the last `overlap` samples of the previous read, so packets straddling two
+	chunks can still be decoded. When the buffer is full a write either waits for space
+	(backpressure) or drops the whole block. Dropped samples are counted, and the overlap is
+	not carried across a drop since the stream is no longer contiguous there.
+
+	Attributes
+	----------
+	capacity : int
+		The number of samples the buffer can hold.
+	overlap : int
+		The number of samples from the end of each read to prepend to the next read.
+	written : int
+		The total number of samples accepted into the buffer.
+	dropped : int
+		The total number of samples dropped because the buffer was full.
+	closed : bool
+		Whether the writer has closed the buffer. Reads drain the remaining samples and then return None.
+	"""
+
+	def __init__(self, capacity, overlap=0, dtype=np.float64):
+		"""
+		Parameters
+		----------
+		capacity : int
+			The number of samples the buffer can hold.
+		overlap : int, optional
+			The number of samples from the end of each read to prepend to the next read.
+		dtype : numpy.dtype, optional
+			The sample type stored in the buffer.
+		"""
+
+		self.capacity = capacity
+		self.overlap = overlap
+		self.written = 0
+		self.dropped = 0
+		self.closed = False
+
+		self._buffer = np.zeros(capacity, dtype=dtype)
+		self._cond = threading.Condition()
+		self._head = 0 # Stream position of the next sample written
+		self._tail = 0 # Stream position of the next sample read
+		self._gaps = deque() # (stream position, number of samples dropped there)
+		self._skipped = 0 # Dropped samples the reader has already passed
+		self._prev = self._buffer[:0].copy()
+
+	def __len__(self):
+		"""
+		Returns the number of unread samples in the buffer.
+		"""
+		return self._head - self._tail
+
+	@property
+	def drop_rate(self):
+		"""
+		The fraction of samples received by the buffer that were dropped.
+		"""
+		total = self.written + self.dropped
+		return self.dropped / total if total > 0 else 0.0
+
+	def write(self, samples, block=False, timeout=None):
+		"""
+		Copies a block of samples into the buffer.
+
+		Parameters
+		----------
+		samples : numpy.array
+			The samples to write. Must not be longer than the buffer's capacity.
+		block : bool, optional
+			If True, wait for the reader to free enough space. Otherwise drop the block when the buffer is full.
+		timeout : float, optional
+			The maximum number of seconds to wait for space when blocking. Waits indefinitely if unset.
+
+		Returns
+		-------
+		bool
+			True if the samples were written, False if they were dropped.
+		"""
+
+		n = len(samples)
+		if n > self.capacity:
+			raise ValueError(f"Cannot write {n} samples to a ring buffer of {self.capacity} samples")
+
+		with self._cond:
+			if block:
+				self._cond.wait_for(lambda: self.closed or self.capacity - len(self) >= n, timeout)
+
+			if self.closed:
+				return False
+
+			if self.capacity - len(self) < n:
+				self.dropped += n
+				self._gaps.append((self._head, n))
+				return False
+
+			# Copy the block in, wrapping around the end of the buffer
+			start = self._head % self.capacity
+			first = min(n, self.capacity - start)
+			self._buffer[start : start + first] = samples[:first]
+			self._buffer[: n - first] = samples[first:]
+
+			self._head += n
+			self.written += n
+			self._cond.notify_all()
+
+		return True
+
+	def read(self, n_samples, timeout=None):
+		"""
+		Reads the next block of samples, prefixed with the overlap from the previous read.
+
+		Waits until n_samples are available. Returns fewer samples if the stream has a gap
+		(dropped samples) or the buffer was closed before that many samples arrived.
+
+		Parameters
+		----------
+		n_samples : int
+			The number of new samples to read.
+		timeout : float, optional
+			The maximum number of seconds to wait for samples. Waits indefinitely if unset.
+
+		Returns
+		-------
+		numpy.array
+			The overlap followed by the new samples. None if the wait timed out or the buffer is closed and empty.
+		int
+			The stream offset of the first returned sample, counting dropped samples.
+		"""
+
+		with self._cond:
+			while True:
+				# Never read across a gap, the samples on either side are not contiguous
+				while self._gaps and self._gaps[0][0] == self._tail:
+					self._skipped += self._gaps.popleft()[1]
+					self._prev = self._prev[:0]
+
+				limit = self._gaps[0][0] if self._gaps else self._head
+				available = limit - self._tail
+				if available >= n_samples or (available > 0 and (self._gaps or self.closed)):
+					break
+				if self.closed:
+					return None, self._tail + self._skipped
+				if not self._cond.wait(timeout):
+					return None, self._tail + self._skipped
+
+			n = min(n_samples, available)
+			start = self._tail % self.capacity
+			first = min(n, self.capacity - start)
+			y = np.concatenate([self._prev, self._buffer[start : start + first], self._buffer[: n - first]])
+
+			offset = self._tail + self._skipped - len(self._prev)
+			self._tail += n
+			self._cond.notify_all()
+
+		self._prev = y[max(len(y) - self.overlap, 0):].copy() if self.overlap > 0 else y[:0]
+
+		return y, offset
+
+	def close(self):
+		"""
+		Closes the buffer. Blocked writers return and readers drain the remaining samples.
+		"""
+		with self._cond:
+			self.closed = True
+			self._cond.notify_all()
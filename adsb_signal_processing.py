@@ -1,44 +1,274 @@
 import numpy as np
 from numpy import *
-import pyModeS as pms
+import time
 
-def detectPreamble(y):
+import adsb_crc as crc
+
+# Sample offsets of the preamble's pulses (high) and gaps (low) within its 16-sample window
+PREAMBLE_OFFSETS = np.arange(16)
+PREAMBLE_HIGH = np.array([0, 2, 7, 9])
+PREAMBLE_LOW = np.array([1, 3, 4, 5, 6, 8, 10, 11, 12, 13, 14, 15])
+
+def _build_magnitude_lut():
+	"""Builds the lookup table from a raw RTL-SDR I/Q byte pair to the sample's magnitude.
+	
+	Returns
+	-------
+	numpy.array
+		65536 float32 entries, indexed by the I/Q byte pair viewed as a native uint16.
+		Matches abs() of the complex samples returned by `RtlSdr.read_samples`.
+	"""
+	
+	iq = np.arange(65536, dtype=np.uint16).view(np.uint8).reshape(-1, 2)
+	iq = iq / 127.5 - 1
+	
+	return np.hypot(iq[:, 0], iq[:, 1]).astype(np.float32)
+
+MAGNITUDE_LUT = _build_magnitude_lut()
+
+# Number of samples in a preamble followed by a long (112-bit) message
+ROW_SIZE = 16 + 112 * 2
+ROW_OFFSETS = np.arange(ROW_SIZE)
+# Number of samples in a preamble followed by a short (56-bit) message
+SHORT_ROW_SIZE = 16 + 56 * 2
+
+# The noise level is estimated from the median of every NOISE_DECIMATION-th sample in each block of BLOCK_SIZE samples,
+# smoothed by the median over the last NOISE_WINDOW blocks
+BLOCK_SIZE = 1024
+NOISE_DECIMATION = 8
+NOISE_WINDOW = 32
+# The detection threshold over the noise level. On pure noise, about the same as the mean plus five standard deviations
+THRESHOLD_FACTOR = 3.8
+
+# A preamble candidate is dropped if a neighbour within this many samples (half a preamble) has a higher score
+NMS_RADIUS = 8
+
+def iq_to_magnitude(raw, out=None):
+	"""Converts raw interleaved I/Q bytes from an RTL-SDR into sample magnitudes.
+	
+	Parameters
+	----------
+	raw : numpy.array or buffer
+		The raw uint8 samples, as I, Q, I, Q, ...
+	out : numpy.array, optional
+		A float32 array to write the magnitudes into, to avoid allocating a new one for every block.
+		Must hold at least half as many values as there are bytes.
+	
+	Returns
+	-------
+	numpy.array
+		The float32 magnitude of each sample.
+	"""
+	
+	raw = np.frombuffer(raw, dtype=np.uint8)
+	pairs = raw[:len(raw) // 2 * 2].view(np.uint16)
+	
+	if out is not None:
+		out = out[:len(pairs)]
+	
+	return np.take(MAGNITUDE_LUT, pairs, out=out)
+
+def block_noise(y):
+	"""Estimates the noise level of each block of RF signal.
+	
+	The median ignores the few samples of a block that carry transmissions, and only every
+	`NOISE_DECIMATION`-th sample is looked at, so this costs a fraction of a pass over the signal.
+	
+	Parameters
+	----------
+	y : numpy.array
+		The RF signal to analyze.
+	
+	Returns
+	-------
+	numpy.array
+		The median strength of every `BLOCK_SIZE` samples, including a final partial block.
+	"""
+	
+	n_full = len(y) // BLOCK_SIZE
+	noise = _row_median(y[:n_full * BLOCK_SIZE].reshape(n_full, BLOCK_SIZE)[:, ::NOISE_DECIMATION])
+	
+	if n_full * BLOCK_SIZE < len(y):
+		noise = np.append(noise, _row_median(y[None, n_full * BLOCK_SIZE :: NOISE_DECIMATION]))
+	
+	return noise
+
+def _row_median(a):
+	"""
+	Returns the median of each row of a matrix. For an even number of columns, the upper of the two middle values.
+	Several times faster than `np.median`, which sorts and averages.
+	"""
+	k = a.shape[1] // 2
+	return np.partition(a, k, axis=1)[:, k]
+
+def detection_threshold(noise):
+	"""Calculates the preamble detection threshold from the noise level.
+	
+	Parameters
+	----------
+	noise : float or numpy.array
+		The noise level, e.g. of each block from `NoiseFloor.update`.
+	
+	Returns
+	-------
+	float or numpy.array
+		The detection threshold, `THRESHOLD_FACTOR` times the noise level.
+	"""
+	
+	return THRESHOLD_FACTOR * noise
+
+class NoiseFloor:
+	"""Sliding-window noise level estimate, carried from one chunk of RF signal to the next.
+	
+	Each block's noise level is the median of the last `window` block medians, so a burst of
+	strong transmissions barely moves it and it follows slow changes such as gain drift.
+	
+	Attributes
+	----------
+	window : int
+		The number of blocks the block medians are smoothed over.
+	"""
+	
+	def __init__(self, window=NOISE_WINDOW):
+		"""
+		Parameters
+		----------
+		window : int, optional
+			The number of blocks the block medians are smoothed over.
+		"""
+		
+		self.window = window
+		self._history = np.empty(0) # The block medians of the end of the previous chunk
+	
+	def update(self, y):
+		"""
+		Estimates the noise level of each block of the next chunk of RF signal.
+		
+		Parameters
+		----------
+		y : numpy.array
+			The next chunk of RF signal.
+		
+		Returns
+		-------
+		numpy.array
+			The noise level of every `BLOCK_SIZE` samples of the chunk, including a final partial block.
+		"""
+		
+		medians = block_noise(y)
+		if len(medians) == 0:
+			return medians
+		
+		# Before there is any history, assume the noise was the same as at the start of this chunk
+		history = self._history
+		if len(history) < self.window - 1:
+			history = np.concatenate((np.full(self.window - 1 - len(history), medians[0]), history))
+		
+		values = np.concatenate((history, medians))
+		self._history = values[-(self.window - 1):] if self.window > 1 else np.empty(0)
+		
+		return _row_median(np.lib.stride_tricks.sliding_window_view(values, self.window))
+
+def detectPreamble(y, noise=None):
 	"""Returns a list of indices for detected ADS-B preambles in the RF signal.
 	
+	Every sample above the threshold inside a strong transmission tends to match the preamble pattern,
+	so only the best scoring candidate within `NMS_RADIUS` samples is kept (non-maximum suppression).
+	
 	Parameters
 	----------
 	y : numpy.array
 		The RF signal to analyze for ADS-B preambles. Must have a 2MHz sample rate.
+	noise : numpy.array, optional
+		The noise level of every `BLOCK_SIZE` samples of the signal, from `NoiseFloor.update`.
+		By default, estimated from this signal alone.
 	
 	Returns
 	-------
-	list
-		A list of indices of potential preambles in the signal
-	float
-		The noise floor for this chunk. Calculated from the mean strength.
+	numpy.array
+		The indices of potential preambles in the signal, in ascending order.
+	numpy.array
+		The noise level of every `BLOCK_SIZE` samples of the signal.
+	"""
+	
+	if noise is None:
+		noise = NoiseFloor().update(y)
+	thresh = detection_threshold(noise)
+	
+	# Only samples above their block's threshold can start a preamble
+	n_starts = len(y) - 16 if len(y) > 16 else 0
+	idx_preamble = np.flatnonzero(y[:n_starts] >= thresh.min()) if n_starts > 0 else np.zeros(0, dtype=np.int64)
+	idx_preamble = idx_preamble[y[idx_preamble] >= thresh[idx_preamble // BLOCK_SIZE]]
+	
+	# Gather the 16-sample window following every candidate into one matrix
+	chunks = np.abs(y[idx_preamble[:, None] + PREAMBLE_OFFSETS])
+	high_mean = np.mean(chunks[:, PREAMBLE_HIGH], axis=1)
+	low_mean = np.mean(chunks[:, PREAMBLE_LOW], axis=1)
+	
+	# Score each candidate by how far its pulses stand out from its gaps
+	score = high_mean - low_mean
+	matches = score > 0
+	idx_preamble = idx_preamble[matches]
+	
+	return idx_preamble[suppress_non_maximum(idx_preamble, score[matches])], noise
+
+def suppress_non_maximum(idx, score, radius=NMS_RADIUS):
+	"""Finds the candidates that score highest among their neighbours.
+	
+	Parameters
+	----------
+	idx : numpy.array
+		The sample index of each candidate, in ascending order.
+	score : numpy.array
+		The score of each candidate.
+	radius : int, optional
+		How many samples apart two candidates can be and still be neighbours.
+	
+	Returns
+	-------
+	numpy.array
+		A boolean mask of the candidates with no higher scoring neighbour. Of equally scoring
+		neighbours, the first is kept.
 	"""
 	
-	idx_preamble = []
+	keep = np.ones(len(idx), dtype=bool)
 	
-	y_mean = np.mean(y)
-	y_std = np.std(y)
-	thresh = y_mean + 5 * y_std
+	# Indices are unique and ascending, so a neighbour is at most 'radius' positions away in the array
+	for d in range(1, radius + 1):
+		if d >= len(idx):
+			break
+		close = idx[d:] - idx[:-d] <= radius
+		keep[:-d] &= ~(close & (score[d:] > score[:-d]))
+		keep[d:] &= ~(close & (score[:-d] >= score[d:]))
 	
-	for i in range( len(y) - 16 ):
-		if y[i] >= thresh:
-			chunk = abs(y[i : i + 16])
-			high_bits = np.array([chunk[0], chunk[2], chunk[7], chunk[9]])
-			low_bits = np.concatenate([[chunk[1]], chunk[3:7], [chunk[8]], chunk[10:16]])
-			
-			high_mean = np.mean(high_bits)
-			low_mean = np.mean(low_bits)
+	return keep
 
-			if(high_mean > low_mean):
-				idx_preamble.append(i)	
+def skip_overlapping(idx, lengths):
+	"""Walks through decoded messages in order, skipping past the end of each kept message.
+	
+	Parameters
+	----------
+	idx : numpy.array
+		The preamble index of each message, in ascending order.
+	lengths : numpy.array
+		The length of each message in bits, 56 or 112.
+	
+	Returns
+	-------
+	numpy.array
+		A boolean mask of the messages that don't start inside an earlier kept message.
+	"""
+	
+	keep = np.zeros(len(idx), dtype=bool)
+	end = -1
+	for i, (n, length) in enumerate(zip(idx.tolist(), lengths.tolist())):
+		if n >= end:
+			keep[i] = True
+			end = n + 16 + 2 * length
 	
-	return idx_preamble, thresh
+	return keep
 
-def decode_ADSB(signal, fix_1bit_errors=False):
+def decode_ADSB(signal, fix_1bit_errors=False, fix_2bit_errors=False):
 	"""Attempts to decode the given signal as an ADS-B message and calculate SNR.
 	
 	Parameters
@@ -47,6 +277,8 @@ def decode_ADSB(signal, fix_1bit_errors=False):
 		The RF signal to decode. Must have a sample rate of 2MHz and be at least 240 samples long.
 	fix_1bit_errors : bool, optional
 		Whether or not to attempt to fix single bit errors.
+	fix_2bit_errors : bool, optional
+		Whether or not to also attempt to fix two-bit errors in DF17 messages. Requires fix_1bit_errors.
 	
 	Returns
 	-------
@@ -54,31 +286,212 @@ def decode_ADSB(signal, fix_1bit_errors=False):
 		If the CRC check passes, returns the hex string for the ADS-B packet. Returns None if the CRC check fails.
 	"""
 	
-	row_size = 16 + 112 * 2
-	msg = None
-	
 	# Exit if signal's sample size is too small
-	if (len(signal) < row_size):
+	if (len(signal) < ROW_SIZE):
 		return
 	
+	msgs, _ = demodulate_batch(signal, [0])
+	
+	return check_msg(msgs[0].tobytes(), fix_1bit_errors, fix_2bit_errors)
+
+def demodulate_batch(y, idx_preamble):
+	"""Manchester decodes the 112 bits following each preamble candidate in one pass.
+	
+	Parameters
+	----------
+	y : numpy.array
+		The RF signal the candidates were detected in. Must have a 2MHz sample rate.
+	idx_preamble : numpy.array
+		The indices of potential preambles in the signal.
+	
+	Returns
+	-------
+	numpy.array
+		A (N, 14) uint8 matrix holding the packed 112-bit message of each candidate, one per row.
+	numpy.array
+		The indices of the decoded candidates. Candidates too close to the end of the signal
+		to hold a full message are dropped.
+	"""
+	
+	idx_preamble = np.asarray(idx_preamble, dtype=np.int64)
+	idx_preamble = idx_preamble[idx_preamble + ROW_SIZE <= len(y)]
+	
+	# Gather the samples of every candidate into a 2-D matrix, one candidate per row
+	samples = y[idx_preamble[:, None] + ROW_OFFSETS]
+	
 	# Decode the signal to binary (assume Manchester encoded)
 	# Taken from the EE123 Lab 2 code
-	bits = signal[16::2] > signal[17::2]
-	tmp =  ''.join(['1' if x else '0' for x in bits])
-	msg = hex(int(tmp,2))[2:]
+	bits = samples[:, 16::2] > samples[:, 17::2]
+	
+	return np.packbits(bits, axis=1), idx_preamble
+
+def _overlaps(starts, ends, span_starts, span_ends):
+	"""
+	Returns a boolean mask of the intervals [start, end) that overlap any of a set of ascending, non-overlapping spans.
+	"""
+	if len(span_starts) == 0:
+		return np.zeros(len(starts), dtype=bool)
+	
+	# The first span ending after each interval starts is the only one that can overlap it
+	j = np.searchsorted(span_ends, starts, side='right')
+	return (j < len(span_starts)) & (span_starts[np.minimum(j, len(span_starts) - 1)] < ends)
+
+def decode_ADSB_batch(y, idx_preamble, fix_1bit_errors=False, fix_2bit_errors=False, stats=None):
+	"""Attempts to decode every preamble candidate in the signal as an ADS-B message.
+	
+	Parameters
+	----------
+	y : numpy.array
+		The RF signal the candidates were detected in. Must have a 2MHz sample rate.
+	idx_preamble : numpy.array
+		The indices of potential preambles in the signal.
+	fix_1bit_errors : bool, optional
+		Whether or not to attempt to fix single bit errors.
+	fix_2bit_errors : bool, optional
+		Whether or not to also attempt to fix two-bit errors in DF17 messages. Requires fix_1bit_errors.
+	stats : dict, optional
+		Adds the seconds spent in the 'demodulate', 'crc' and 'correct' stages and the number of
+		'valid' and 'corrected' messages to this dict, see `decode_chunk`.
+	
+	Once a message passes the CRC check, candidates that start inside it are skipped, so a
+	transmission is only decoded once. Messages that pass without correction take precedence
+	over corrected ones.
+	
+	Returns
+	-------
+	list of (int, str)
+		The preamble index and hex string of every candidate that passed the CRC check.
+	"""
+	
+	start = time.perf_counter()
+	msgs, idx_preamble = demodulate_batch(y, idx_preamble)
+	demodulated = time.perf_counter()
+	
+	# CRC check every candidate as a long and as a short message at once
+	crc_long = crc.crc24_batch(msgs)
+	crc_short = crc.crc24_batch(msgs[:, :7])
+	is_long = crc_long == 0
+	is_short = ~is_long & (crc_short == 0)
+	
+	# Skip the candidates inside a message that passed
+	valid = np.flatnonzero(is_long | is_short)
+	skipped = valid[~skip_overlapping(idx_preamble[valid], np.where(is_long[valid], 112, 56))]
+	is_long[skipped] = False
+	is_short[skipped] = False
+	checked = time.perf_counter()
+	
+	n_fixed = 0
+	if fix_1bit_errors:
+		# Only correct candidates that failed both checks and don't overlap a message that passed
+		valid = np.flatnonzero(is_long | is_short)
+		starts = idx_preamble[valid]
+		ends = starts + np.where(is_long[valid], ROW_SIZE, SHORT_ROW_SIZE)
+		failed = ~(is_long | is_short) & ~_overlaps(idx_preamble, idx_preamble + SHORT_ROW_SIZE, starts, ends)
+		msgs, fixed_long = crc.fix_errors_batch(msgs, np.where(failed, crc_long, 0), fix_2bit_errors)
+		short_msgs, fixed_short = crc.fix_errors_batch(msgs[:, :7], np.where(failed & ~fixed_long, crc_short, 0))
+		msgs[fixed_short, :7] = short_msgs[fixed_short]
+		
+		# Corrected messages can still overlap each other
+		fixed = np.flatnonzero(fixed_long | fixed_short)
+		skipped = fixed[~skip_overlapping(idx_preamble[fixed], np.where(fixed_long[fixed], 112, 56))]
+		fixed_long[skipped] = False
+		fixed_short[skipped] = False
+		
+		is_long |= fixed_long
+		is_short |= fixed_short
+		
+		n_fixed = np.count_nonzero(fixed_long) + np.count_nonzero(fixed_short)
+		if n_fixed > 0:
+			print( '*' * n_fixed , end='', flush=True )
+	
+	decoded = []
+	for i in np.flatnonzero(is_long | is_short).tolist():
+		msg = msgs[i].tobytes() if is_long[i] else msgs[i, :7].tobytes()
+		decoded.append((int(idx_preamble[i]), msg.hex()))
+	
+	if stats != None:
+		_add_stats(stats, demodulate=demodulated - start, crc=checked - demodulated, valid=len(decoded), corrected=n_fixed)
+		if fix_1bit_errors:
+			_add_stats(stats, correct=time.perf_counter() - checked)
+	
+	return decoded
+
+def _add_stats(stats, **values):
+	"""
+	Adds values to the statistics in a dict.
+	"""
+	for key, value in values.items():
+		stats[key] = stats.get(key, 0) + value
+
+def check_msg(msg, fix_1bit_errors=False, fix_2bit_errors=False):
+	"""Runs the CRC check on a demodulated 112-bit message.
+	
+	Parameters
+	----------
+	msg : bytes
+		The demodulated 112-bit message as 14 raw bytes.
+	fix_1bit_errors : bool, optional
+		Whether or not to attempt to fix single bit errors.
+	fix_2bit_errors : bool, optional
+		Whether or not to also attempt to fix two-bit errors in DF17 messages. Requires fix_1bit_errors.
+	
+	Returns
+	-------
+	string
+		The hex string of the long or short ADS-B message that passed the CRC check.
+		Returns None if the CRC check fails.
+	"""
 	
 	# CRC check for long message
-	if (pms.crc(msg) == 0):
-		return msg
+	if (crc.crc24(msg) == 0):
+		return msg.hex()
 	# CRC check for short message
-	elif (pms.crc(msg[:14]) == 0):
-		return msg[:14]
+	elif (crc.crc24(msg[:7]) == 0):
+		return msg[:7].hex()
 	
 	if fix_1bit_errors:
-		return correct_single_bit_error(msg)
+		return correct_single_bit_error(msg.hex(), fix_2bit_errors)
 	else:
 		return None
 
+def decode_chunk(y, fix_1bit_errors=False, fix_2bit_errors=False, noise=None, stats=None):
+	"""Detects, decodes and measures every ADS-B message in a chunk of RF signal.
+	
+	Parameters
+	----------
+	y : numpy.array
+		The RF signal to decode. Must have a 2MHz sample rate.
+	fix_1bit_errors : bool, optional
+		Whether or not to attempt to fix single bit errors.
+	fix_2bit_errors : bool, optional
+		Whether or not to also attempt to fix two-bit errors in DF17 messages. Requires fix_1bit_errors.
+	noise : numpy.array, optional
+		The noise level of every `BLOCK_SIZE` samples of the signal, from `NoiseFloor.update`.
+		By default, estimated from this signal alone.
+	stats : dict, optional
+		Adds statistics about this chunk to this dict: the seconds spent in the 'detect', 'demodulate',
+		'crc' and 'correct' stages and the number of preamble 'candidates', 'valid' messages and
+		'corrected' messages. Values are added to what the dict already holds.
+	
+	Returns
+	-------
+	list of (int, str, float)
+		The preamble index, hex string and SNR of every message that passed the CRC check, in ascending index order.
+		The SNR is measured against the noise level of the block the message starts in.
+	"""
+	
+	start = time.perf_counter()
+	idx_preamble, noise = detectPreamble(y, noise)
+	if stats != None:
+		_add_stats(stats, detect=time.perf_counter() - start, candidates=len(idx_preamble))
+	
+	decoded = []
+	for n, msg in decode_ADSB_batch(y, idx_preamble, fix_1bit_errors, fix_2bit_errors, stats):
+		snr = SNR(y[n : n + ROW_SIZE], noise[n // BLOCK_SIZE])
+		decoded.append((n, msg, snr))
+	
+	return decoded
+
 def SNR(signal, noise_floor):
 	"""Calculates the SNR of the signal based on a given noise floor.
 	
@@ -100,13 +513,18 @@ def SNR(signal, noise_floor):
 	
 	return snr
 	
-def correct_single_bit_error(msg):
+def correct_single_bit_error(msg, fix_2bit_errors=False):
 	"""Attempts to correct a bit-flip error in an ADS-B message.
 	
+	Uses the CRC syndrome tables from `adsb_crc`, so the cost is one CRC and one table lookup
+	per message length instead of one CRC per bit position.
+	
 	Parameters
 	----------
 	msg : str
 		The hex-string ADS-B message.
+	fix_2bit_errors : bool, optional
+		Whether or not to also attempt to fix two-bit errors in DF17 messages.
 	
 	Returns
 	-------
@@ -115,28 +533,15 @@ def correct_single_bit_error(msg):
 		Returns None if no solution found.
 	"""
 	
-	num = int(msg, 16)
-	bit_length = len(bin(num)[2:])
-	
-	for k in range(bit_length):
-		test_num = num ^ (1 << k)
-		test_msg = hex(test_num)[2:]
-		
-		# CRC check for long message
-		if (pms.crc(test_msg) == 0):
-			print( '*' , end='', flush=True )
-			return test_msg
-		# CRC check for short message
-		elif (pms.crc(test_msg[:14]) == 0):
-			print( '*' , end='', flush=True )
-			return test_msg[:14]
-	
-	return None
-	
-	
-	
-	
-	
+	data = bytes.fromhex(msg)
 	
+	# Attempt to correct it as a long message, then as a short message
+	fixed = crc.fix_errors(data, fix_2bit_errors)
+	if fixed == None and len(data) > 7:
+		fixed = crc.fix_errors(data[:7])
 	
+	if fixed == None:
+		return None
 	
+	print( '*' , end='', flush=True )
+	return fixed.hex()
@@ -0,0 +1,256 @@
+import json
+import queue
+import threading
+
+from flask import Response
+
+# Short field names used in the streamed aircraft state, with their snapshot column
+AIRCRAFT_FIELDS = (('flight', 'callsign'), ('lat', 'lat'), ('lon', 'lon'), ('alt', 'altitude'), ('spd', 'velocity'), ('hdg', 'heading'), ('seen', 'last_update'))
+# Snapshot columns holding whole numbers
+INTEGER_COLUMNS = ('altitude',)
+
+def aircraft_rows(snapshot):
+	"""
+	Converts a columnar AircraftStore snapshot into JSON-ready rows.
+
+	Parameters
+	----------
+	snapshot : dict of (str : numpy.array)
+		The columns returned by `AircraftStore.snapshot`.
+
+	Returns
+	-------
+	dict of (str : tuple)
+		Maps each ICAO address to its values in `AIRCRAFT_FIELDS` order. Unknown values are None.
+	"""
+
+	columns = []
+	for _, key in AIRCRAFT_FIELDS:
+		values = snapshot[key].tolist()
+		if key in INTEGER_COLUMNS:
+			values = [None if v != v else int(v) for v in values]
+		elif snapshot[key].dtype != object:
+			values = [None if v != v else v for v in values]
+		columns.append(values)
+
+	return dict(zip(snapshot['icao'].tolist(), zip(*columns)))
+
+def packet_dict(packet):
+	"""
+	Returns the JSON-ready fields of a packet.
+	"""
+	return { 't' : packet.timestamp, 'icao' : packet.icao, 'df' : packet.df, 'msg' : packet.msg, 'snr' : None if packet.snr == None else float(packet.snr) }
+
+def sse_event(event, data):
+	"""
+	Serializes an object as a server-sent event.
+	"""
+	return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+class Broadcaster:
+	"""Fans pre-serialized events out to every subscriber.
+
+	Each subscriber gets a bounded queue. An event is serialized once and the same bytes are put in
+	every queue. A subscriber that falls a full queue behind is dropped instead of slowing the others.
+
+	Attributes
+	----------
+	queue_size : int
+		The number of events a subscriber may fall behind before it is dropped.
+	dropped : int
+		The number of subscribers dropped for falling behind.
+	"""
+
+	def __init__(self, queue_size=64):
+		"""
+		Parameters
+		----------
+		queue_size : int, optional
+			The number of events a subscriber may fall behind before it is dropped.
+		"""
+
+		self.queue_size = queue_size
+		self.dropped = 0
+
+		self._subscribers = set()
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._subscribers)
+
+	def subscribe(self):
+		"""
+		Returns a new subscriber queue. Events published from now on are put in it.
+		"""
+		subscriber = queue.Queue(self.queue_size)
+		with self._lock:
+			self._subscribers.add(subscriber)
+		return subscriber
+
+	def unsubscribe(self, subscriber):
+		"""
+		Stops putting events in a subscriber queue.
+		"""
+		with self._lock:
+			self._subscribers.discard(subscriber)
+
+	def is_subscribed(self, subscriber):
+		"""
+		Returns whether a subscriber queue still receives events. False once it was dropped for falling behind.
+		"""
+		return subscriber in self._subscribers
+
+	def publish(self, payload):
+		"""
+		Puts a serialized event in every subscriber queue. Never blocks.
+		"""
+		with self._lock:
+			subscribers = list(self._subscribers)
+
+		for subscriber in subscribers:
+			try:
+				subscriber.put_nowait(payload)
+			except queue.Full:
+				self.unsubscribe(subscriber)
+				self.dropped += 1
+
+class AircraftStream:
+	"""Publishes live aircraft and packet updates as server-sent events.
+
+	A background thread watches the tracker and, whenever it changed, publishes one 'delta' event
+	holding the fields that changed for each aircraft, the aircraft that were removed and the packets
+	received since the last event. New subscribers first get a 'snapshot' event with every tracked
+	aircraft; deltas with a version at or below the snapshot's can be ignored.
+
+	Events
+	------
+	snapshot : { "version" : int, "aircraft" : { icao : { field : value } } }
+	delta : { "version" : int, "aircraft" : { icao : { changed field : value } }, "removed" : [icao], "packets" : [packet] }
+
+	Attributes
+	----------
+	broadcaster : adsb_stream.Broadcaster
+		Delivers the events to the subscribers.
+	"""
+
+	def __init__(self, planes, packets, interval=0.5, keepalive=15, max_packets=256):
+		"""
+		Parameters
+		----------
+		planes : adsb_objects.AircraftStore
+			The tracked aircraft.
+		packets : adsb_objects.PacketBuffer
+			The buffer of received packets.
+		interval : float, optional
+			How often to check the tracker for changes, in seconds.
+		keepalive : float, optional
+			How often to send a comment to idle subscribers, in seconds, so proxies keep the connection open.
+		max_packets : int, optional
+			The maximum number of packets in a delta event.
+		"""
+
+		self.planes = planes
+		self.packets = packets
+		self.interval = interval
+		self.keepalive = keepalive
+		self.max_packets = max_packets
+		self.broadcaster = Broadcaster()
+
+		self._version, snapshot = planes.snapshot()
+		self._rows = aircraft_rows(snapshot)
+		self._seq = packets.seq
+		self._snapshot = (None, None)
+		self._snapshot_lock = threading.Lock()
+		self._stop = threading.Event()
+		self._thread = threading.Thread(target=self._run, name='AircraftStream', daemon=True)
+
+	def start(self):
+		"""
+		Starts publishing updates.
+		"""
+		self._thread.start()
+
+	def stop(self):
+		"""
+		Stops publishing updates.
+		"""
+		self._stop.set()
+		self._thread.join()
+
+	def snapshot_event(self):
+		"""
+		Returns the serialized 'snapshot' event for the current tracker version, shared by every new subscriber.
+		"""
+		with self._snapshot_lock:
+			version, snapshot = self.planes.snapshot()
+			if self._snapshot[0] != version:
+				aircraft = { icao : dict(zip((f for f, _ in AIRCRAFT_FIELDS), row)) for icao, row in aircraft_rows(snapshot).items() }
+				self._snapshot = (version, sse_event('snapshot', { 'version' : version, 'aircraft' : aircraft }))
+			return self._snapshot[1]
+
+	def publish(self):
+		"""
+		Publishes a 'delta' event if the tracker changed since the last one.
+		"""
+
+		version = self.planes.version
+		seq = self.packets.seq
+		if version == self._version and seq == self._seq:
+			return
+
+		version, snapshot = self.planes.snapshot()
+		rows = aircraft_rows(snapshot)
+
+		changed = {}
+		for icao, row in rows.items():
+			previous = self._rows.get(icao)
+			if previous == None:
+				changed[icao] = { field : value for (field, _), value in zip(AIRCRAFT_FIELDS, row) }
+			elif previous != row:
+				changed[icao] = { field : value for (field, _), value, old in zip(AIRCRAFT_FIELDS, row, previous) if value != old }
+		removed = [ icao for icao in self._rows if icao not in rows ]
+
+		seq, new_packets = self.packets.since(self._seq, self.max_packets)
+
+		self._rows = rows
+		self._version = version
+		self._seq = seq
+
+		if changed or removed or new_packets:
+			self.broadcaster.publish(sse_event('delta', {
+				'version' : version,
+				'aircraft' : changed,
+				'removed' : removed,
+				'packets' : [ packet_dict(p) for p in new_packets ]
+			}))
+
+	def _run(self):
+		"""
+		Background thread. Publishes updates until stopped.
+		"""
+		while not self._stop.wait(self.interval):
+			self.publish()
+
+	def events(self):
+		"""
+		Yields the serialized events for one subscriber, starting with a snapshot. Ends when the subscriber is dropped.
+		"""
+
+		subscriber = self.broadcaster.subscribe()
+		try:
+			yield self.snapshot_event()
+			while True:
+				try:
+					yield subscriber.get(timeout=self.keepalive)
+				except queue.Empty:
+					if not self.broadcaster.is_subscribed(subscriber):
+						return
+					yield b': keepalive\n\n'
+		finally:
+			self.broadcaster.unsubscribe(subscriber)
+
+	def response(self):
+		"""
+		Returns a streaming Flask response of server-sent events for a new subscriber.
+		"""
+		return Response(self.events(), mimetype='text/event-stream', headers={ 'Cache-Control' : 'no-cache', 'X-Accel-Buffering' : 'no' })
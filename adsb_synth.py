@@ -0,0 +1,177 @@
+import numpy as np
+
+import adsb_crc as crc
+
+# Valid messages from real aircraft, for scenarios that need realistic content
+SAMPLE_MESSAGES = [
+	'8d4840d6202cc371c32ce0576098', # DF17 identification
+	'8d40621d58c382d690c8ac2863a7', # DF17 airborne position
+	'8d40621d58c386435cc412692ad6', # DF17 airborne position
+	'8d485020994409940838175b284f', # DF17 velocity
+	'8da05f219b06b6af189400cbc33f', # DF17 velocity
+]
+
+def make_message(df, icao, payload=0, ca=5):
+	"""Builds a valid DF11 or DF17 message with the correct parity.
+
+	Parameters
+	----------
+	df : int
+		The downlink format. 11 for an all-call reply or 17 for an extended squitter.
+	icao : int
+		The 24-bit ICAO address.
+	payload : int, optional
+		The 56-bit ME field of a DF17 message. Ignored for DF11.
+	ca : int, optional
+		The 3-bit capability field.
+
+	Returns
+	-------
+	str
+		The message as a hex string.
+	"""
+
+	if df == 11:
+		data = ((df << 27) | (ca << 24) | icao).to_bytes(4, 'big')
+	else:
+		data = ((df << 83) | (ca << 80) | (icao << 56) | payload).to_bytes(11, 'big')
+
+	parity = crc.crc24(data + b'\x00\x00\x00')
+
+	return (data + parity.to_bytes(3, 'big')).hex()
+
+def random_messages(n, df17_fraction=0.8, n_aircraft=20, seed=None):
+	"""Builds random valid DF17 and DF11 messages from a small fleet of aircraft.
+
+	DF17 messages are identification, airborne position or velocity messages with random content.
+
+	Parameters
+	----------
+	n : int
+		The number of messages.
+	df17_fraction : float, optional
+		The fraction of messages that are DF17. The rest are DF11.
+	n_aircraft : int, optional
+		The number of distinct ICAO addresses to use.
+	seed : int, optional
+		The random seed.
+
+	Returns
+	-------
+	list of str
+		The messages as hex strings.
+	"""
+
+	rng = np.random.default_rng(seed)
+	fleet = rng.integers(0, 1 << 24, n_aircraft).tolist()
+
+	msgs = []
+	for _ in range(n):
+		icao = fleet[rng.integers(n_aircraft)]
+		if rng.random() < df17_fraction:
+			# Random identification, airborne position or ground speed velocity content
+			tc = [4, 11, 19][rng.integers(3)]
+			payload = (tc << 51) | int(rng.integers(0, 1 << 48, dtype=np.uint64))
+			if tc == 19:
+				payload |= 1 << 48
+			msgs.append(make_message(17, icao, payload))
+		else:
+			msgs.append(make_message(11, icao))
+
+	return msgs
+
+def modulate(msg):
+	"""Pulse position modulates a message at 2MHz, preamble included.
+
+	Parameters
+	----------
+	msg : str
+		The message as a hex string.
+
+	Returns
+	-------
+	numpy.array
+		The unit amplitude pulse train. 16 preamble samples followed by 2 samples per bit.
+	"""
+
+	bits = np.unpackbits(np.frombuffer(bytes.fromhex(msg), dtype=np.uint8))
+
+	pulses = np.zeros(16 + 2 * len(bits), dtype=np.float32)
+	pulses[[0, 2, 7, 9]] = 1
+	# A 1 bit is a pulse in the first half of the bit period, a 0 bit in the second half
+	pulses[16 + 2 * np.arange(len(bits)) + (1 - bits)] = 1
+
+	return pulses
+
+def generate(msgs, n_samples, snr_db=20, rate=None, overlap=0.0, freq_offset=0.0, fs=2e6, seed=None):
+	"""Generates complex baseband samples carrying the given messages in Gaussian noise.
+
+	Parameters
+	----------
+	msgs : list of str
+		The hex string messages to transmit. Transmitted in order, cycling if `rate` asks for more.
+	n_samples : int
+		The number of samples to generate.
+	snr_db : float, optional
+		The pulse power over the noise power, in dB.
+	rate : float, optional
+		Messages per second. By default, every message in `msgs` is transmitted once.
+	overlap : float, optional
+		The fraction of messages that start while the previous message is still being transmitted.
+	freq_offset : float, optional
+		The carrier frequency offset of the transmissions in Hz.
+	fs : float, optional
+		The sample rate in Hz.
+	seed : int, optional
+		The random seed.
+
+	Returns
+	-------
+	numpy.array
+		The complex64 samples, scaled like `RtlSdr.read_samples`.
+	list of (int, str)
+		The ground truth: the preamble index and hex string of each transmitted message, in index order.
+	"""
+
+	rng = np.random.default_rng(seed)
+	n_msgs = len(msgs) if rate == None else int(rate * n_samples / fs)
+
+	# Spread the start of each message over the signal, then move some into the previous message
+	starts = np.sort(rng.integers(0, n_samples - 240, n_msgs))
+	if n_msgs > 1 and overlap > 0:
+		moved = np.flatnonzero(rng.random(n_msgs - 1) < overlap) + 1
+		starts[moved] = starts[moved - 1] + rng.integers(16, 224, len(moved))
+		starts = np.sort(np.minimum(starts, n_samples - 240))
+
+	noise_rms = 0.05
+	amplitude = noise_rms * 10 ** (snr_db / 20)
+	iq = (rng.normal(size=n_samples) + 1j * rng.normal(size=n_samples)) * (noise_rms / np.sqrt(2))
+
+	truth = []
+	for i, start in enumerate(starts.tolist()):
+		msg = msgs[i % len(msgs)]
+		pulses = modulate(msg)
+		t = np.arange(len(pulses)) / fs
+		carrier = np.exp(1j * (2 * np.pi * freq_offset * t + rng.uniform(0, 2 * np.pi)))
+		iq[start : start + len(pulses)] += amplitude * pulses * carrier
+		truth.append((start, msg))
+
+	return iq.astype(np.complex64), truth
+
+def to_cu8(iq):
+	"""Converts complex samples to rtl_sdr's interleaved uint8 I/Q format, e.g. for `main.py --input-file`.
+
+	Parameters
+	----------
+	iq : numpy.array
+		The complex samples, scaled like `RtlSdr.read_samples`.
+
+	Returns
+	-------
+	numpy.array
+		The interleaved uint8 I/Q samples.
+	"""
+
+	interleaved = np.stack([iq.real, iq.imag], axis=1).ravel()
+
+	return np.clip(np.round((interleaved + 1) * 127.5), 0, 255).astype(np.uint8)
@@ -0,0 +1,147 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import adsb_signal_processing as asp
+
+# Shared memory segments attached by this worker process, by name
+_segments = {}
+
+def _attach(name):
+	"""
+	Attaches to a shared memory segment created by the parent process, reusing earlier attachments.
+	"""
+	if name not in _segments:
+		_segments[name] = shared_memory.SharedMemory(name=name)
+	
+	return _segments[name]
+
+def _decode_range(name, length, dtype, start, stop, noise, fix_1bit_errors, fix_2bit_errors):
+	"""
+	Worker task. Decodes the messages whose preambles start in samples [start, stop) of the shared chunk.
+	'start' is a multiple of `BLOCK_SIZE` and 'noise' holds the noise level of every block of the chunk.
+	
+	Candidates are also detected in a margin on either side of the range, and the messages found there
+	are discarded, as they belong to the neighbouring ranges. A message starting before the range can
+	cover candidates inside it, and a message starting just after it prevents correcting the candidates
+	that overlap it. With the margins, both are handled as if the chunk was decoded in one piece.
+	
+	Returns
+	-------
+	list of (int, str, float)
+		The preamble index in the chunk, hex string and SNR of every decoded message.
+	dict
+		The decoding statistics, see `adsb_signal_processing.decode_chunk`. These include the margins,
+		so the candidates there are counted by two workers.
+	"""
+	
+	shm = _attach(name)
+	y = np.ndarray((length,), dtype=dtype, buffer=shm.buf)
+	
+	# One block before the range is longer than any message and keeps the blocks aligned with the noise levels.
+	# After the range, candidates are detected for a short message's length, and their messages read in full.
+	lo = max(start - asp.BLOCK_SIZE, 0)
+	y = y[lo : min(stop + asp.SHORT_ROW_SIZE + asp.ROW_SIZE - 1, length)]
+	
+	stats = {}
+	decoded = asp.decode_chunk(y, fix_1bit_errors, fix_2bit_errors, noise[lo // asp.BLOCK_SIZE :], stats)
+	
+	return [(n + lo, msg, snr) for n, msg, snr in decoded if n + lo >= start and n + lo < stop], stats
+
+class DecodePool:
+	"""Pool of worker processes that decode sub-ranges of a chunk in parallel.
+	
+	Chunks are copied once into a shared memory buffer instead of being pickled to the workers.
+	Each worker decodes the preambles starting in its own sub-range, looking at a margin on either
+	side so messages overlapping its edges are skipped and corrected as if the chunk was decoded in
+	one piece. The results are merged back in sample order.
+	
+	Attributes
+	----------
+	n_workers : int
+		The number of worker processes.
+	capacity : int
+		The maximum number of samples in a chunk.
+	"""
+	
+	def __init__(self, n_workers, capacity, fix_1bit_errors=False, fix_2bit_errors=False, dtype=np.float64):
+		"""
+		Parameters
+		----------
+		n_workers : int
+			The number of worker processes.
+		capacity : int
+			The maximum number of samples in a chunk.
+		fix_1bit_errors : bool, optional
+			Whether or not to attempt to fix single bit errors.
+		fix_2bit_errors : bool, optional
+			Whether or not to also attempt to fix two-bit errors in DF17 messages.
+		dtype : numpy.dtype, optional
+			The sample type of the chunks.
+		"""
+		
+		self.n_workers = n_workers
+		self.capacity = capacity
+		self.fix_1bit_errors = fix_1bit_errors
+		self.fix_2bit_errors = fix_2bit_errors
+		
+		self._dtype = np.dtype(dtype)
+		self._shm = shared_memory.SharedMemory(create=True, size=capacity * self._dtype.itemsize)
+		self._samples = np.ndarray((capacity,), dtype=self._dtype, buffer=self._shm.buf)
+		self._executor = ProcessPoolExecutor(n_workers)
+		self._noise = asp.NoiseFloor()
+	
+	def decode(self, y, stats=None):
+		"""
+		Detects, decodes and measures every ADS-B message in a chunk using the worker processes.
+		
+		Parameters
+		----------
+		y : numpy.array
+			The RF signal to decode. Must have a 2MHz sample rate and at most `capacity` samples.
+		stats : dict, optional
+			Adds the workers' decoding statistics to this dict, see `adsb_signal_processing.decode_chunk`.
+		
+		Returns
+		-------
+		list of (int, str, float)
+			The preamble index, hex string and SNR of every message that passed the CRC check, in ascending index order.
+		"""
+		
+		length = len(y)
+		if length > self.capacity:
+			raise ValueError(f"Cannot decode {length} samples with a pool capacity of {self.capacity} samples")
+		
+		self._samples[:length] = y
+		
+		# Estimate the noise for the whole chunk, as if it was decoded in one piece
+		noise = self._noise.update(y)
+		
+		# Split the chunk on block boundaries, so each worker's blocks line up with the noise estimates
+		n_blocks = len(noise)
+		# Python ints, so the sample offsets of decoded messages are too and can be serialized
+		bounds = (np.linspace(0, n_blocks, self.n_workers + 1).astype(int) * asp.BLOCK_SIZE).tolist()
+		bounds[-1] = length
+		futures = [
+			self._executor.submit(_decode_range, self._shm.name, length, self._dtype.str, start, stop, noise, self.fix_1bit_errors, self.fix_2bit_errors)
+			for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start
+		]
+		
+		decoded = []
+		for f in futures:
+			worker_decoded, worker_stats = f.result()
+			decoded.extend(worker_decoded)
+			if stats != None:
+				for key, value in worker_stats.items():
+					stats[key] = stats.get(key, 0) + value
+		
+		return sorted(decoded)
+	
+	def close(self):
+		"""
+		Stops the worker processes and releases the shared memory buffer.
+		"""
+		self._executor.shutdown()
+		self._samples = None
+		self._shm.close()
+		self._shm.unlink()
@@ -1,10 +1,18 @@
 import dash
-import dash_core_components as dcc
-import dash_html_components as html
-from dash.dependencies import Input, Output
+from dash import dcc, html, Input, Output, State, Patch, no_update
+from dash.exceptions import PreventUpdate
+
+import threading
+import time
+from collections import deque
 
 import plotly.express as px
-import pandas as pd
+import numpy as np
+
+import adsb_api
+import adsb_history
+import adsb_metrics
+import adsb_stream
 
 # Suppress non-error logging to the console
 import logging
@@ -15,81 +23,255 @@ external_stylesheets = ['app.css']
 mapstyle = 'carto-positron'
 app = dash.Dash(__name__, title='ADS-B Tracker', update_title=None, external_stylesheets=external_stylesheets)
 
-def generate_table(df, max_rows=26):
+COLUMNS = [('ICAO', 'icao'), ('Callsign', 'callsign'), ('Latitude', 'lat'), ('Longitude', 'lon'), ('Altitude', 'altitude'),
+		   ('Velocity', 'velocity'), ('Heading', 'heading'), ('Age', 'age')]
+
+def generate_table(planes, max_rows=26):
 	"""
-	Generate an HTML table for a DataFrame using Dash HTML components. Taken from: https://stackoverflow.com/questions/52213738/html-dash-table
+	Generate an HTML table of the tracked aircraft using Dash HTML components. Adapted from: https://stackoverflow.com/questions/52213738/html-dash-table
 	
 	Parameters
 	----------
-	df : pd.DataFrame
-		The DataFrame to convert into an HTML table.
+	planes : dict(np.array)
+		Columns of aircraft information, as returned by 'planes_to_columns'.
 	max_rows : int, optional
 		The maximum number of rows to output into the table.
 	
 	Returns
 	-------
 	html.Table
-		The HTML version of the given DataFrame.
+		The HTML version of the given aircraft information.
 	
 	"""
 	
-	table = [html.Caption("Tracked Aircraft")] + [html.Tr([html.Th(col) for col in df.columns]) ] + [html.Tr([html.Td(df.iloc[i][col]) for col in df.columns]) for i in range(min(len(df), max_rows))]
+	n_rows = min(len(planes['icao']), max_rows)
+	cells = [planes[key][:n_rows].tolist() for _, key in COLUMNS]
+	
+	table = [html.Caption("Tracked Aircraft")] + [html.Tr([html.Th(col) for col, _ in COLUMNS]) ] + [html.Tr([html.Td(col[i]) for col in cells]) for i in range(n_rows)]
 			
 	return html.Table(
 		children=table
     )
 	
 	
-def planes_to_df(planes):
+def planes_to_columns(planes):
+	"""
+	Convert a snapshot of the tracked aircraft into display-ready columns.
+	Unknown numeric values are converted from NaN to None, and the age of each aircraft is calculated.
+	The 'last_update' column is kept as well, so the ages can be brought up to date later.
+	
+	Parameters
+	----------
+	planes : ao.AircraftStore
+		The tracked aircraft.
+	
+	Returns
+	-------
+	dict(np.array)
+		The 'icao', 'callsign', 'lat', 'lon', 'altitude', 'velocity', 'heading', 'age' and 'last_update' columns.
+	"""
+	
+	_, snapshot = planes.snapshot()
+	
+	columns = { 'icao' : snapshot['icao'], 'callsign' : snapshot['callsign'] }
+	for key in ['lat', 'lon', 'altitude', 'velocity', 'heading']:
+		known = ~np.isnan(snapshot[key])
+		values = np.full(len(known), None, dtype=object)
+		values[known] = snapshot[key][known].astype(int if key == 'altitude' else float).tolist()
+		columns[key] = values
+	columns['last_update'] = snapshot['last_update']
+	columns['age'] = (time.time() - snapshot['last_update']).astype(int)
+	
+	return columns
+	
+	
+def trails_to_lines(planes):
+	"""
+	Join the simplified trails of the tracked aircraft into a single line trace.
+	Each trail is followed by a None, which breaks the line between aircraft.
+	
+	Parameters
+	----------
+	planes : ao.AircraftStore
+		The tracked aircraft.
+	
+	Returns
+	-------
+	list(float)
+		The latitudes of the trace.
+	list(float)
+		The longitudes of the trace.
+	"""
+	
+	_, trails = planes.trails()
+	
+	lat = []
+	lon = []
+	for trail_lat, trail_lon in trails.values():
+		lat += trail_lat.tolist()
+		lat.append(None)
+		lon += trail_lon.tolist()
+		lon.append(None)
+	
+	return lat, lon
+
+def generate_metrics_table(registry=adsb_metrics.REGISTRY):
 	"""
-	Convert a dict of Plane objects into a pd.DataFrame.
-	Performs check to properly handle and convert an empty dictionary.
+	Generate an HTML table summarizing the pipeline metrics.
 	
 	Parameters
 	----------
-	planes : dict(ao.Plane)
-		A dictionary of Plane objects. Key value is arbitrary.
+	registry : adsb_metrics.Registry, optional
+		The metrics to summarize.
 	
 	Returns
 	-------
-	pd.DataFrame
-		An 8-column DataFrame converted from the dictionary.
+	html.Table
+		The throughput, backlog and mean time per call of each pipeline stage.
 	"""
 	
-	if len(planes) > 0:
-		df = pd.DataFrame( planes.values() )
-	else:
-		df = pd.DataFrame( [None] * 7 + [0] )
-		df = df.T
+	def value(name, labels=()):
+		metric = registry.get(name)
+		return metric.values().get(labels, 0) if metric != None else 0
+	
+	candidates = value('adsb_preamble_candidates_total')
+	valid = value('adsb_messages_valid_total')
+	rows = [
+		('Chunks processed', f"{value('adsb_chunks_total')}"),
+		('Processing load', f"{value('adsb_processing_load'):.2f}"),
+		('Ring buffer', f"{value('adsb_buffer_samples')} / {value('adsb_buffer_capacity_samples')} samples"),
+		('Dropped', f"{value('adsb_chunks_dropped_total')} chunks, {value('adsb_samples_dropped_total')} samples"),
+		('Valid / candidates', f"{valid} / {candidates}" + (f" ({valid / candidates:.1%})" if candidates > 0 else '')),
+		('Corrected', f"{value('adsb_messages_corrected_total')}"),
+	]
+	
+	stage_seconds = registry.get('adsb_stage_seconds').values()
+	for stage in adsb_metrics.STAGES:
+		if (stage,) in stage_seconds:
+			n, total = stage_seconds[(stage,)]
+			rows.append((f'{stage.capitalize()} time', f'{total / n * 1000:.2f} ms/call'))
 	
-	df.columns = ['ICAO', 'Callsign', 'Latitude', 'Longitude', 'Altitude', 'Velocity', 'Heading', 'Age']
+	by_df = {}
+	for (df, _), count in registry.get('adsb_messages_total').values().items():
+		by_df[df] = by_df.get(df, 0) + count
+	if by_df:
+		rows.append(('Messages by DF', ', '.join(f'DF{df}: {count}' for df, count in sorted(by_df.items()))))
 	
-	return df
+	table = [html.Caption("Pipeline")] + [html.Tr([html.Th(name), html.Td(text)]) for name, text in rows]
 	
+	return html.Table(children=table)
 	
-def server(pos_ref, planes, packets):
+def server(pos_ref, planes, packets, history=None):
 	"""
 	Setup the Dash web server to display air traffic information.
+	Also serves live updates as server-sent events on '/stream', see adsb_stream.AircraftStream,
+	and the tracker state as JSON on '/data/aircraft.json' and '/data/packets.json', see adsb_api.register.
+	The pipeline metrics are served in the Prometheus text format on '/metrics' and summarized in a panel.
+	If a history store is given, it can be queried on '/data/history/', see adsb_history.register.
+	
+	The dashboard is refreshed by a single callback. Each browser tab remembers the tracker version and
+	packet sequence number it last displayed, and is only sent the parts that changed since then. The map
+	is updated by patching the aircraft trace instead of sending a new figure. The aircraft table is also
+	sent once a second, so its ages keep counting while no packets arrive. Renders are cached per version,
+	and the table per version and second, so every open tab shares the same work.
 	
 	Parameters
 	----------
 	pos_ref : list(float)
 		The location of the tracker's ground station. Used as the initial center for the map.
-	planes : dict(ao.Plane)
-		Dictionary of the currently tracked aircraft.
-		Dictionary of the currently tracked aircraft.
+	planes : ao.AircraftStore
+		The currently tracked aircraft.
 		Positions are plotted on the map and detailed information is displayed in the table.
-	packets : list(ao.Packet)
-		List of the last received ADS-B packets. Their information and timestamp is displayed on the dashboard.	
+	packets : ao.PacketBuffer
+		Buffer of the last received ADS-B packets. Their information and timestamp is displayed on the dashboard.	
+	history : adsb_history.HistoryStore, optional
+		The database of every received packet and position fix.
 	"""
 	
-	# Initial setup for the map
-	df = planes_to_df(planes)
+	# Rendered lines of the newest packets, newest first, and the sequence number they are current to.
+	# Only packets received since the last update are converted to strings.
+	MAX_LINES = 25
+	packet_lines = { 'seq' : 0, 'lines' : deque(maxlen=MAX_LINES), 'pre' : html.Pre(children="") }
+	# The aircraft and trail traces and table columns for the latest tracker version
+	aircraft = { 'version' : None }
+	# The aircraft table for the latest tracker version and second
+	table = { 'key' : None }
+	render_lock = threading.Lock()
+	
+	def render_aircraft():
+		"""
+		Returns the aircraft and trail trace data and table columns for the current tracker version, rendering them if needed.
+		"""
+		with render_lock:
+			version = planes.version
+			if aircraft['version'] != version:
+				columns = planes_to_columns(planes)
+				trail_lat, trail_lon = trails_to_lines(planes)
+				aircraft.update({
+					'version' : version,
+					'lat' : columns['lat'].tolist(),
+					'lon' : columns['lon'].tolist(),
+					'text' : columns['icao'].tolist(),
+					'trail_lat' : trail_lat,
+					'trail_lon' : trail_lon,
+					'columns' : columns
+				})
+			return dict(aircraft)
+	
+	def render_table(current):
+		"""
+		Returns the aircraft table for a render of `render_aircraft`, with the ages as of the current second.
+		"""
+		now = time.time()
+		with render_lock:
+			key = (current['version'], int(now))
+			if table['key'] != key:
+				columns = dict(current['columns'])
+				columns['age'] = (now - columns['last_update']).astype(int)
+				table.update({ 'key' : key, 'table' : generate_table(columns) })
+			return table['table']
+	
+	def render_packets():
+		"""
+		Returns the packet display for the current packet sequence number, rendering the new packets if needed.
+		"""
+		with render_lock:
+			seq, new_packets = packets.since(packet_lines['seq'], MAX_LINES)
+			if seq != packet_lines['seq']:
+				for p in new_packets:
+					packet_lines['lines'].appendleft(str(p) + '\n')
+				packet_lines['seq'] = seq
+				packet_lines['pre'] = html.Pre(children="Last received ADS-B Packets:\n" + ''.join(packet_lines['lines']))
+			return seq, packet_lines['pre']
+	
+	# Push live aircraft deltas and packets to '/stream' subscribers
+	stream = adsb_stream.AircraftStream(planes, packets)
+	stream.start()
+	app.server.add_url_rule('/stream', 'stream', stream.response)
+	
+	# Serve the tracker state as JSON on '/data/aircraft.json' and '/data/packets.json'
+	adsb_api.register(app.server, planes, packets)
+	
+	# Serve the pipeline metrics on '/metrics'
+	adsb_metrics.register(app.server)
+	
+	# Serve history queries on '/data/history/'
+	if history != None:
+		adsb_history.register(app.server, history)
+	
+	# Initial setup for the map. The ground station trace never changes, the trail and aircraft traces are patched.
+	current = render_aircraft()
 	map = px.scatter_mapbox(center={ 'lat' : pos_ref[0], 'lon' : pos_ref[1] }, mapbox_style = mapstyle)
+	map['layout']['uirevision'] = True
+	map['layout']['margin']['t'] = 5
+	map['layout']['margin']['b'] = 5
+	map.add_scattermapbox(lat=[pos_ref[0]], lon=[pos_ref[1]], text='Grnd Stn', hoverinfo="text", name='Ground Station')
+	map.add_scattermapbox(lat=current['trail_lat'], lon=current['trail_lon'], mode='lines', hoverinfo='skip', name='Trails')
+	map.add_scattermapbox(lat=current['lat'], lon=current['lon'], text=current['text'], hoverinfo="text", name='Aircraft')
 	
 	# Setting up the div information for the aircraft table and packet displays
 	adsb_table_div = html.Div(
-		children=generate_table(df),
+		children=render_table(current),
 		id='adsb-table',
 		style={
 			"width" : "50%"
@@ -124,48 +306,69 @@ def server(pos_ref, planes, packets):
 			}
 		),		
 	
+		# Pipeline metrics
+		html.Div(
+			id='metrics-panel',
+			children=generate_metrics_table()
+		),
+		
 		# Request an update every second
 		dcc.Interval(
 				id='interval-component',
 				interval=1*1000, # in milliseconds
 				n_intervals=0
+		),
+		
+		# Refresh the metrics panel less often
+		dcc.Interval(
+				id='metrics-interval',
+				interval=5*1000, # in milliseconds
+				n_intervals=0
+		),
+		
+		# The tracker version and packet sequence number this tab is displaying
+		dcc.Store(
+			id='displayed',
+			data={ 'version' : None, 'seq' : None, 'second' : None }
 		)]
 	)
 
-	# Function to update map data
-	@app.callback(Output('adsb-map', 'figure'),
-				  [Input('interval-component', 'n_intervals')])
-	def update_map(n):
-		df = planes_to_df(planes)
-		
-		map = px.scatter_mapbox(center={ 'lat' : pos_ref[0], 'lon' : pos_ref[1] }, mapbox_style = mapstyle)
-		map['layout']['uirevision'] = True
-		map['layout']['margin']['t'] = 5
-		map['layout']['margin']['b'] = 5
+	# Function to update the map, aircraft table and packet display with what changed
+	@app.callback([Output('adsb-map', 'figure'), Output('adsb-table', 'children'), Output('packet-list', 'children'), Output('displayed', 'data')],
+				  [Input('interval-component', 'n_intervals')],
+				  [State('displayed', 'data')])
+	def update_dashboard(n, displayed):
+		displayed = displayed or {}
+		version = planes.version
+		seq = packets.seq
+		second = int(time.time())
 		
-		map.add_scattermapbox(lat=[pos_ref[0]], lon=[pos_ref[1]], text='Grnd Stn', hoverinfo="text", name='Ground Station')
-		map.add_scattermapbox(lat=df['Latitude'], lon=df['Longitude'], text=df['ICAO'], hoverinfo="text", name='Aircraft')
+		if displayed.get('version') == version and displayed.get('seq') == seq and displayed.get('second') == second:
+			raise PreventUpdate
 		
-		return map
-
-	# Function to update the aircraft table
-	@app.callback(Output('adsb-table', 'children'),
-				  [Input('interval-component', 'n_intervals')])
-	def update_table(n):
-		df = planes_to_df(planes)
-		return generate_table(df)
-
-	# Function to update packet display
-	@app.callback(Output('packet-list', 'children'),
-				  [Input('interval-component', 'n_intervals')])		
-	def update_packets(n):
-		MAX_LINES = 25
-				
-		out_str = ""
+		map_update = table_update = packet_update = no_update
 		
-		for p in packets[-MAX_LINES:]:
-			out_str = str(p) + '\n' + out_str
+		# The table's ages change every second even when the aircraft don't
+		if displayed.get('version') != version or displayed.get('second') != second:
+			current = render_aircraft()
+			
+			if displayed.get('version') != current['version']:
+				map_update = Patch()
+				map_update['data'][1]['lat'] = current['trail_lat']
+				map_update['data'][1]['lon'] = current['trail_lon']
+				map_update['data'][2]['lat'] = current['lat']
+				map_update['data'][2]['lon'] = current['lon']
+				map_update['data'][2]['text'] = current['text']
+			
+			version = current['version']
+			table_update = render_table(current)
 		
-		out_str = "Last received ADS-B Packets:\n" + out_str
+		if displayed.get('seq') != seq:
+			seq, packet_update = render_packets()
 		
-		return html.Pre(children=out_str)
\ No newline at end of file
+		return map_update, table_update, packet_update, { 'version' : version, 'seq' : seq, 'second' : second }
+	
+	# Function to refresh the metrics panel
+	@app.callback(Output('metrics-panel', 'children'), [Input('metrics-interval', 'n_intervals')])
+	def update_metrics(n):
+		return generate_metrics_table()
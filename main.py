@@ -1,95 +1,296 @@
 # Import functions and libraries
 import numpy as np
 from numpy import *
-from rtlsdr import RtlSdr
+try:
+	from rtlsdr import RtlSdr
+except ImportError:
+	RtlSdr = None # Only needed for live input; recordings can be replayed without librtlsdr
 import pyModeS as pms
-import threading, time, queue
+import threading, time
 import pandas as pd
 import time
 import argparse
 import requests
+import sqlite3
 
 # Import program modules
 import adsb_signal_processing as asp
 import adsb_objects as ao
+from adsb_ringbuffer import SampleRingBuffer
+from adsb_workers import DecodePool
+from adsb_logger import PacketLogger
+from adsb_history import HistoryStore
+from adsb_output import OutputServers
+from adsb_input import Feed, FeedMerger
+import adsb_metrics as metrics
 import app
 
-planes = {}
-packets = []
-PACKET_BUFF_SIZE = 256
 TTL = 100
+planes = ao.AircraftStore(TTL)
+PACKET_BUFF_SIZE = 256
+packets = ao.PacketBuffer(PACKET_BUFF_SIZE)
+ASYNC_READ_BYTES = 262144 # Raw bytes per asynchronous RTL-SDR read (2 bytes per sample)
 
-def sdr_read( Qin, sdr, N_samples, stop_flag ):
+def sdr_read( samples, sdr, N_samples, stop_flag ):
 	"""
 	Modified from UC Berkeley's EE123 course. Processes reads N_samples from the RTL-SDR and provides it
 		to the 'signal_process' thread.
+	Chunks that don't fit in the ring buffer are dropped and counted rather than blocking the RTL-SDR.
 	"""
 	while (  not stop_flag.is_set() ):
 		try:
-			data_chunk = abs(sdr.read_samples(N_samples))   # get samples 
+			start = time.perf_counter()
+			iq = sdr.read_samples(N_samples)   # get samples 
+			read = time.perf_counter()
+			data_chunk = abs(iq)
+			metrics.STAGE_SECONDS.observe( read - start, ('read',) )
+			metrics.STAGE_SECONDS.observe( time.perf_counter() - read, ('magnitude',) )
 		except Exception as e:
 			print("\n*** Error reading RTLSDR - ", e, " ***")
 			print("Stopping threads...")
 			stop_flag.set()
+			break
 			
-		Qin.put( data_chunk ) # append to list
+		if not samples.write( data_chunk ): # append to the ring buffer
+			metrics.DROPPED_CHUNKS.inc()
 
+	samples.close()
 	sdr.close()
 
-def signal_process( Qin, source, stop_flag, log, pos_ref, FIX_1BIT_ERRORS=False  ):
+def sdr_read_async( samples, sdr, stop_flag ):
+	"""
+	Streams raw I/Q bytes from the RTL-SDR and provides their magnitudes to the 'signal_process' thread.
+	Each block is converted with a lookup table into a reused float32 buffer instead of building complex samples.
+	"""
+	magnitudes = np.empty( ASYNC_READ_BYTES // 2, dtype=np.float32 )
+	
+	def on_bytes( raw, context ):
+		if stop_flag.is_set():
+			sdr.cancel_read_async()
+			return
+		
+		with metrics.STAGE_SECONDS.time( ('magnitude',) ):
+			data_chunk = asp.iq_to_magnitude(raw, magnitudes)
+		
+		if not samples.write( data_chunk ): # append to the ring buffer
+			metrics.DROPPED_CHUNKS.inc()
+	
+	try:
+		sdr.read_bytes_async( on_bytes, ASYNC_READ_BYTES )
+	except Exception as e:
+		print("\n*** Error reading RTLSDR - ", e, " ***")
+		print("Stopping threads...")
+		stop_flag.set()
+
+	samples.close()
+	sdr.close()
+
+def open_recording( path, fmt=None ):
+	"""
+	Memory-maps an IQ recording.
+	
+	Parameters
+	----------
+	path : str
+		The recording to open.
+	fmt : str, optional
+		'cu8' for interleaved uint8 I/Q (rtl_sdr output) or 'cf32' for complex64 samples.
+		By default, determined from the file extension and assumed to be 'cu8' if unknown.
+	
+	Returns
+	-------
+	numpy.memmap
+		The recording's raw bytes for 'cu8' or its complex samples for 'cf32'.
+	str
+		The recording's format.
+	"""
+	if fmt == None:
+		ext = path.rsplit('.', 1)[-1].lower()
+		fmt = 'cf32' if ext in ('cf32', 'fc32', 'c64', 'complex64', 'cfile') else 'cu8'
+	
+	dtype = np.complex64 if fmt == 'cf32' else np.uint8
+	
+	return np.memmap( path, dtype=dtype, mode='r' ), fmt
+
+def file_read( samples, recording, fmt, N_samples, stop_flag, fs, realtime=False ):
+	"""
+	Replays a memory-mapped IQ recording into the 'signal_process' thread.
+	Waits for the processor instead of dropping chunks, so the recording is processed as fast as the CPU allows
+	unless 'realtime' is set, in which case chunks are paced at the sample rate 'fs'.
+	"""
+	step = 2 * N_samples if fmt == 'cu8' else N_samples
+	magnitudes = np.empty( N_samples, dtype=np.float32 )
+	start_time = time.perf_counter()
+	
+	try:
+		for i, n in enumerate( range(0, len(recording), step) ):
+			if stop_flag.is_set():
+				break
+			
+			if realtime:
+				delay = start_time + i * N_samples / fs - time.perf_counter()
+				if delay > 0:
+					time.sleep( delay )
+			
+			# Reading a memory-mapped recording happens while converting it
+			with metrics.STAGE_SECONDS.time( ('magnitude',) ):
+				if fmt == 'cu8':
+					data_chunk = asp.iq_to_magnitude( recording[n : n + step], magnitudes )
+				else:
+					data_chunk = np.abs( recording[n : n + step] )
+			
+			# Wait for the processor to make room; only fails once the ring buffer is closed
+			if not samples.write( data_chunk, block=True ):
+				break
+	finally:
+		samples.close()
+
+def signal_process( samples, N_samples, stop_flag, logger, pos_ref, FIX_1BIT_ERRORS=False, FIX_2BIT_ERRORS=False, pool=None, outputs=None, fs=2000000, history=None ):
 	"""
 	Modified from UC Berkeley's EE123 course. Processes RF chunks provided by the 'sdr_read' thread.
+	Chunks are decoded by the worker processes of 'pool' if one is given.
+	Each chunk's packets are handed to the TCP output servers in 'outputs', if given, without waiting on their clients.
+	Packets and position fixes are queued for the 'history' store, if given, which writes them in the background.
+	The time spent in each stage is recorded in adsb_metrics, along with how long each chunk took compared to the 'fs' sample rate.
+	Runs until 'stop_flag' is set or the ring buffer is closed and drained, then returns the number of decoded messages.
 	"""
 
-	row_size = 16 + 112*2 #240 bits
+	dropped = 0
+	n_decoded = 0
+	noise = asp.NoiseFloor() # Carried across chunks, so the threshold follows the noise instead of each chunk's traffic
 	
 	while(  not stop_flag.is_set() ):
-		curr_time = time.strftime('%d/%b/%Y %H:%M:%S', time.localtime())
+		# Get streaming chunk from sdr_read thread, along with the end of the previous chunk
+		y, offset = samples.read( N_samples, timeout=1 )
+		if y is None:
+			if samples.closed:
+				break
+			continue
 		
-		# Get streaming chunk from sdr_read thread
-		y = Qin.get();
+		if samples.dropped > dropped:
+			print( f"\n*** Dropped {samples.dropped - dropped} samples, {samples.drop_rate:.2%} of all samples so far ***" )
+			dropped = samples.dropped
 			
-		packet_diff = len(packets)
-		idx_preamble, noise_floor = asp.detectPreamble(y)		
-		for n in idx_preamble:
-			signal = abs(y[int(n) : int(n) + row_size])
-			msg = asp.decode_ADSB( signal, FIX_1BIT_ERRORS )
-			if msg != None:
-				snr = asp.SNR(signal, noise_floor)
-				pkt = ao.Packet(msg, time.time(), snr)
-				packets.append( pkt )
-				print( '!' , end='', flush=True )
-				
-				if len(packets) > PACKET_BUFF_SIZE:
-					packets.pop(0)
-				
-				if log != None:
-					try:
-						with open(log, 'a') as f:
-							f.write(f"[{curr_time}] {msg}\n")
-					except:
-						print(f"Error writing to {log}!")
-				
-				if pkt.icao in planes:
-					planes[pkt.icao].process_packet( pkt )
-				elif pkt.icao != None:
-					planes[pkt.icao] = ao.Plane( pkt, pos_ref )
+		start = time.perf_counter()
+		last_seq = packets.seq
+		stats = {}
+		if pool != None:
+			decoded = pool.decode( y, stats )
+		else:
+			decoded = asp.decode_chunk( y, FIX_1BIT_ERRORS, FIX_2BIT_ERRORS, noise.update(y), stats )
+		metrics.record_decode( stats )
 		
-		if packet_diff == len(packets):
-			# packets.append(f"[{curr_time}] None received...")
-			print( '.' , end='', flush=True )
+		n_decoded += len(decoded)
+		tracked = time.perf_counter()
 		
-		# Remove excess objects
-		to_delete = []
-		for p in planes.keys():
-			if (time.time() - planes[p].last_update) >= TTL:
-				to_delete.append(p)
+		# Decoded messages are in sample order, so packets are processed in the order they were received
+		received = ao.Packet.from_batch( [msg for _, msg, _ in decoded], time.time(), [snr for _, _, snr in decoded] )
+		records = []
+		for (n, _, _), pkt in zip( decoded, received ):
+			packets.append( pkt )
+			print( '!' , end='', flush=True )
+			
+			if logger != None:
+				logger.log( pkt, offset + n )
+			
+			metrics.record_packet( pkt )
+			plane = planes.update( pkt, pos_ref )
+			
+			if history != None:
+				history.record( pkt, plane )
+			
+			if outputs != None:
+				records.append( (pkt, plane.pos if plane != None else None, offset + n) )
+		
+		if outputs != None:
+			outputs.publish( records )
 		
-		for p in to_delete:
-			planes.pop(p)
+		if last_seq == packets.seq:
+			print( '.' , end='', flush=True )
 		
-		Qin.queue.clear()
+		# Remove objects we haven't heard from in a while
+		expired = time.perf_counter()
+		planes.expire()
+		end = time.perf_counter()
+		
+		metrics.STAGE_SECONDS.observe( expired - tracked, ('track',) )
+		metrics.STAGE_SECONDS.observe( end - expired, ('expire',) )
+		metrics.CHUNKS.inc()
+		metrics.SAMPLES.inc( len(y) - samples.overlap )
+		metrics.PROCESSING_LOAD.set( (end - start) * fs / N_samples )
+	
+	# Release a reader waiting for room in the ring buffer
+	samples.close()
+	
+	if pool != None:
+		pool.close()
 	
+	return n_decoded
+	
+
+def replay( samples, t_file_read, stop_flag, port, fs, logger, pos_ref, N_samples, FIX_1BIT_ERRORS=False, FIX_2BIT_ERRORS=False, pool=None, outputs=None, history=None ):
+	"""
+	Processes a recording being replayed by the 'file_read' thread in the main thread, then prints a summary.
+	The Dash web server runs in the background while the recording is processed.
+	"""
+	t_server = threading.Thread(target = app.app.run, kwargs = { 'port' : port }, daemon = True)
+	t_server.start()
+	t_file_read.start()
+	
+	start_time = time.perf_counter()
+	try:
+		n_decoded = signal_process( samples, N_samples, stop_flag, logger, pos_ref, FIX_1BIT_ERRORS, FIX_2BIT_ERRORS, pool, outputs, fs, history )
+	except KeyboardInterrupt:
+		print("\nStopping threads...")
+		stop_flag.set()
+		samples.close()
+		t_file_read.join()
+		raise
+	finally:
+		if logger != None:
+			logger.close()
+		if outputs != None:
+			outputs.close()
+		if history != None:
+			history.close()
+	elapsed = time.perf_counter() - start_time
+	t_file_read.join()
+	
+	duration = samples.written / fs
+	print()
+	if duration == 0 or elapsed == 0:
+		print("No samples replayed")
+		return
+	print(f"Replayed {samples.written} samples ({duration:.1f}s of signal) in {elapsed:.1f}s, {duration / elapsed:.1f}x real time")
+	print(f"Decoded {n_decoded} messages, {n_decoded / elapsed:.1f} messages/s ({n_decoded / duration:.1f} per second of signal)")
+
+def merge( merger, port, logger, outputs, history=None ):
+	"""
+	Merges the receivers' feeds in the background while the Dash web server runs, then prints a summary.
+	"""
+	merger.start()
+	for feed in merger.feeds:
+		print(f"Reading {feed}")
+	
+	try:
+		app.app.run(port = port)
+	finally:
+		merger.stop()
+		if logger != None:
+			logger.close()
+		if outputs != None:
+			outputs.close()
+		if history != None:
+			history.close()
+	
+	print()
+	print(f"Merged {merger.merged} messages, dropped {merger.duplicates} duplicates and {merger.invalid} invalid messages")
+
+def is_yes(arg):
+	"""
+	Returns whether a [Y/N] command line argument was set to yes.
+	"""
+	return arg[0] in ('Y', 'y', '1', 'T', 't')
 		
 def main():
 	# Setup cli arguments
@@ -114,6 +315,12 @@ def main():
 		default=100,
 		help="Delete a tracked object if we haven't heard from it for TTL seconds. Default to 100 seconds."
 	)
+	parser.add_argument('--packet-buffer',
+		type=int,
+		default=PACKET_BUFF_SIZE,
+		dest='packet_buffer',
+		help=f'How many of the most recent packets to keep for the dashboard. Default to {PACKET_BUFF_SIZE} packets.'
+	)
 	parser.add_argument('--port', '-p',
 		type=int, 
 		default=8050, 
@@ -124,12 +331,115 @@ def main():
 		default=None, 
 		help='Where to log information on detected ADS-B packets. Does not log if unset.'
 	)
+	parser.add_argument('--log-format',
+		type=str,
+		choices=PacketLogger.FORMATS,
+		default='text',
+		dest='log_format',
+		help="The --log format: 'text' lines, newline-delimited JSON with SNR and sample offset, or compact binary records. Default to 'text'."
+	)
+	parser.add_argument('--log-max-bytes',
+		type=int,
+		default=None,
+		metavar='BYTES',
+		dest='log_max_bytes',
+		help='Rotate the --log file once it grows past this many bytes. Does not rotate by size if unset.'
+	)
+	parser.add_argument('--log-rotate-seconds',
+		type=float,
+		default=None,
+		metavar='SECONDS',
+		dest='log_rotate_seconds',
+		help='Rotate the --log file after this many seconds. Does not rotate by time if unset.'
+	)
+	parser.add_argument('--history-db',
+		type=str,
+		default=None,
+		metavar='FILE',
+		dest='history_db',
+		help='Record every packet and position fix in this SQLite database, which can be queried on /data/history/. Does not record them if unset.'
+	)
+	parser.add_argument('--sbs-port',
+		type=int,
+		default=None,
+		metavar='PORT',
+		dest='sbs_port',
+		help='Serve decoded packets as BaseStation (SBS-1) CSV lines on this TCP port, usually 30003. Does not serve them if unset.'
+	)
+	parser.add_argument('--beast-port',
+		type=int,
+		default=None,
+		metavar='PORT',
+		dest='beast_port',
+		help='Serve decoded packets as Beast binary frames on this TCP port, usually 30005. Does not serve them if unset.'
+	)
+	parser.add_argument('--avr-port',
+		type=int,
+		default=None,
+		metavar='PORT',
+		dest='avr_port',
+		help='Serve decoded packets as raw AVR hex lines on this TCP port, usually 30002. Does not serve them if unset.'
+	)
 	parser.add_argument('--fix-single-bit-errors',
 		type=str,
 		default='No',
 		metavar='[Y/N]',
 		dest='fix_single_bit_errors',
-		help='Have the decoder attempt to fix single bit errors in packets. VERY RESOURCE INTENSIVE AT THIS TIME!!!'
+		help='Have the decoder attempt to fix single bit errors in packets.'
+	)
+	parser.add_argument('--fix-two-bit-errors',
+		type=str,
+		default='No',
+		metavar='[Y/N]',
+		dest='fix_two_bit_errors',
+		help='Have the decoder also attempt to fix two-bit errors in DF17 packets. Requires --fix-single-bit-errors.'
+	)
+	parser.add_argument('--async-read',
+		type=str,
+		default='No',
+		metavar='[Y/N]',
+		dest='async_read',
+		help='Stream raw bytes from the RTL-SDR asynchronously and convert them with a lookup table. Uses far less memory and CPU per chunk.'
+	)
+	parser.add_argument('--workers', '-w',
+		type=int,
+		default=0,
+		metavar='N',
+		help='Decode each chunk in parallel with N worker processes. Decodes in the processing thread if unset.'
+	)
+	parser.add_argument('--input-file', '-i',
+		type=str,
+		default=None,
+		metavar='FILE',
+		dest='input_file',
+		help='Replay an IQ recording at 2MHz instead of listening to an RTL-SDR, then print a summary. Processes it as fast as possible by default.'
+	)
+	parser.add_argument('--input-format',
+		type=str,
+		choices=['cu8', 'cf32'],
+		default=None,
+		dest='input_format',
+		help="The recording's sample format: 'cu8' for rtl_sdr's uint8 I/Q or 'cf32' for complex64. Determined from the file extension if unset."
+	)
+	parser.add_argument('--realtime',
+		type=str,
+		default='No',
+		metavar='[Y/N]',
+		help='Pace the replay of --input-file at the recording\'s real time instead of as fast as possible.'
+	)
+	parser.add_argument('--connect', '-c',
+		type=str,
+		action='append',
+		default=None,
+		metavar='HOST[:PORT[:FORMAT]]',
+		help="Merge the feed of a remote receiver instead of listening to an RTL-SDR. FORMAT is 'beast' or 'avr'. Default to 'avr' on port 30002 and 'beast' on port 30005 otherwise. Can be repeated to merge several receivers."
+	)
+	parser.add_argument('--dedup-window',
+		type=float,
+		default=1.0,
+		metavar='SECONDS',
+		dest='dedup_window',
+		help='Drop a message from a --connect feed if another feed delivered it within this many seconds. Default to 1 second.'
 	)
 	args = parser.parse_args()
 	
@@ -138,6 +448,7 @@ def main():
 	center_freq = 1090e6 # 1090 MHz center frequency
 	gain = 49.6 # Gain
 	N_samples = 2048000 # SDR samples for each chunk of data ( Approx 1.024 seconds per chunk )
+	buffer_chunks = 4 # How many chunks the reader can get ahead of the processor before dropping samples
 	TTL = args.TTL # How long to store ADS-B object information
 	log = args.log # Where to log packets
 	
@@ -154,39 +465,109 @@ def main():
 	else:
 		pos_ref = [args.location[0], args.location[1]]
 	
-	# Determine whether to fix 1-bit errors
-	FIX_1BIT_ERRORS = (
-		args.fix_single_bit_errors[0] == 'Y' or 
-		args.fix_single_bit_errors[0] == 'y' or 
-		args.fix_single_bit_errors[0] == '1' or 
-		args.fix_single_bit_errors[0] == 'T' or 
-		args.fix_single_bit_errors[0] == 't'
-	)
+	# Determine whether to fix 1-bit and 2-bit errors
+	FIX_1BIT_ERRORS = is_yes(args.fix_single_bit_errors)
+	FIX_2BIT_ERRORS = is_yes(args.fix_two_bit_errors)
+	ASYNC_READ = is_yes(args.async_read)
+	REPLAY = args.input_file != None
+	NETWORK = args.connect != None
+	
+	feeds = []
+	for spec in args.connect or []:
+		try:
+			feeds.append( Feed.parse(spec) )
+		except ValueError as e:
+			print(f"Invalid --connect feed - {e}")
+			exit()
 
 
-	# Setup Dash server
-	app.server(pos_ref, planes, packets)
+	# Buffer of the most recent packets and the tracked aircraft, shared with the dashboard
+	global packets, planes
+	packets = ao.PacketBuffer(args.packet_buffer)
+	planes = ao.AircraftStore(TTL, pos_ref)
 	
-	# Create a queue for communication between the reading and processing threads
-	Qin = queue.Queue()
+	# Setup the history store, which writes to its database in the background
+	history = None
+	if args.history_db != None:
+		try:
+			history = HistoryStore( args.history_db )
+		except sqlite3.Error as e:
+			print(f"Error opening the history database {args.history_db} - {e}")
+			exit()
+		metrics.REGISTRY.counter( 'adsb_history_dropped_total', 'Packets dropped because the history store fell behind.', fn = lambda: history.dropped )
 	
-	# Setup the RTL-SDR reader
-	sdr = RtlSdr(args.rtl_device)
-	sdr.sample_rate = fs	# sampling rate
-	sdr.center_freq = center_freq   # 1090MhZ center frequency
-	sdr.gain = gain
+	# Setup Dash server
+	app.server(pos_ref, planes, packets, history)
+	
+	# Create a ring buffer for communication between the reading and processing threads
+	# Each chunk carries the end of the previous one, so packets that straddle two chunks are decoded
+	# Asynchronous reads and recordings provide float32 magnitudes; synchronous reads provide abs() of complex128 samples
+	dtype = np.float32 if ASYNC_READ or REPLAY else np.float64
+	samples = SampleRingBuffer( buffer_chunks * N_samples, overlap = asp.ROW_SIZE - 1, dtype = dtype )
+	metrics.REGISTRY.gauge( 'adsb_buffer_samples', 'Samples waiting in the ring buffer for the processor.', fn = lambda: len(samples) )
+	metrics.REGISTRY.gauge( 'adsb_buffer_capacity_samples', 'Samples the ring buffer can hold.', fn = lambda: samples.capacity )
+	metrics.REGISTRY.counter( 'adsb_samples_dropped_total', 'Samples dropped because the ring buffer was full.', fn = lambda: samples.dropped )
 	
 	stop_flag = threading.Event()
 	
-	# Setup the reading and processing threads
-	t_sdr_read = threading.Thread(target = sdr_read, args = (Qin, sdr, N_samples, stop_flag  ))
-	t_signal_process = threading.Thread(target = signal_process, args = ( Qin, source, stop_flag, log, pos_ref, FIX_1BIT_ERRORS))
+	# Setup the reading thread from either a recording or the RTL-SDR. Network feeds are read by the FeedMerger instead
+	if REPLAY:
+		recording, fmt = open_recording( args.input_file, args.input_format )
+		t_sdr_read = threading.Thread(target = file_read, args = (samples, recording, fmt, N_samples, stop_flag, fs, is_yes(args.realtime)))
+	elif not NETWORK:
+		if RtlSdr == None:
+			print("pyrtlsdr is not installed. Install it to listen to an RTL-SDR, or replay a recording with --input-file.")
+			exit()
+		
+		sdr = RtlSdr(args.rtl_device)
+		sdr.sample_rate = fs	# sampling rate
+		sdr.center_freq = center_freq   # 1090MhZ center frequency
+		sdr.gain = gain
+	
+		if ASYNC_READ:
+			t_sdr_read = threading.Thread(target = sdr_read_async, args = (samples, sdr, stop_flag  ))
+		else:
+			t_sdr_read = threading.Thread(target = sdr_read, args = (samples, sdr, N_samples, stop_flag  ))
+	
+	# Setup the packet logger, which writes to disk in the background
+	logger = None
+	if log != None:
+		logger = PacketLogger( log, args.log_format, args.log_max_bytes, args.log_rotate_seconds )
+	
+	# Setup the decoding worker processes
+	pool = None
+	if args.workers > 0 and not NETWORK:
+		pool = DecodePool( args.workers, N_samples + samples.overlap, FIX_1BIT_ERRORS, FIX_2BIT_ERRORS, dtype )
+	
+	# Setup the TCP output servers, which serve clients in the background
+	outputs = None
+	ports = { fmt : port for fmt, port in (('sbs', args.sbs_port), ('beast', args.beast_port), ('avr', args.avr_port)) if port != None }
+	if len(ports) > 0:
+		outputs = OutputServers( ports )
+		try:
+			outputs.start()
+		except OSError as e:
+			print(f"Error starting the output servers - {e}")
+			exit()
+		for server in outputs.servers:
+			print(f"Serving {server.fmt} output on port {server.port}")
+	
+	if NETWORK:
+		merger = FeedMerger( feeds, planes, packets, pos_ref, args.dedup_window, logger, outputs, history )
+		merge( merger, args.port, logger, outputs, history )
+		return
+	
+	if REPLAY:
+		replay( samples, t_sdr_read, stop_flag, args.port, fs, logger, pos_ref, N_samples, FIX_1BIT_ERRORS, FIX_2BIT_ERRORS, pool, outputs, history )
+		return
+	
+	t_signal_process = threading.Thread(target = signal_process, args = ( samples, N_samples, stop_flag, logger, pos_ref, FIX_1BIT_ERRORS, FIX_2BIT_ERRORS, pool, outputs, fs, history))
 	
 	t_sdr_read.start()
 	t_signal_process.start()
 	
 	# Run the Dash web server
-	app.app.run_server(port = args.port)
+	app.app.run(port = args.port)
 	
 	# Run until the threads stop
 	while threading.active_count() > 0:
@@ -195,6 +576,12 @@ def main():
 		except:
 			print("Stopping threads...")
 			stop_flag.set()
+			if logger != None:
+				logger.close()
+			if outputs != None:
+				outputs.close()
+			if history != None:
+				history.close()
 			raise
 			exit()
 			